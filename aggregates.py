@@ -0,0 +1,150 @@
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from backends import PandasBackend, configured_backend, get_backend
+from data import CHUNK_ROWS, DATA_PATH, FRAME_VERSIONS, dataset_version, fresh_sidecar, iter_chunks, load_dataset
+from perf import timed_function
+
+# Columns stream_aggregates needs; everything else is dropped while reading
+AGGREGATE_COLUMNS = ['Year', 'Prefecture', 'Company', 'Shinkansen_Line', 'Distance from Tokyo Station']
+
+# Sources at least this large have their rollups streamed in chunks by the pandas backend,
+# so pages that only chart aggregates never hold the whole frame
+STREAM_AGGREGATES_BYTES = 64 * 2**20
+
+# Dimensions the year index keeps running station counts for
+CUBE_DIMENSIONS = ['Prefecture', 'Company', 'Shinkansen_Line']
+
+@timed_function()
+def compute_aggregates(df):
+    # Rollups shared by the chart functions, computed in one place
+    return PandasBackend(df).aggregates()
+
+def stream_aggregates(path=DATA_PATH, chunk_rows=CHUNK_ROWS):
+    # Same rollups as compute_aggregates, accumulated chunk by chunk for sources too big to load
+    totals = {}
+    for chunk in iter_chunks(path, chunk_rows, columns=AGGREGATE_COLUMNS):
+        distance = chunk.groupby('Year')['Distance from Tokyo Station']
+        partial = {
+            'per_year': chunk.groupby('Year').size(),
+            'per_prefecture': chunk['Prefecture'].value_counts(),
+            'per_company': chunk['Company'].value_counts(),
+            'per_line': chunk['Shinkansen_Line'].value_counts(),
+            'distance_sum': distance.sum(),
+            'distance_count': distance.count(),
+        }
+        for key, series in partial.items():
+            totals[key] = series if key not in totals else totals[key].add(series, fill_value=0)
+    if not totals:
+        return compute_aggregates(pd.DataFrame(columns=AGGREGATE_COLUMNS))
+
+    mean_distance = totals.pop('distance_sum') / totals.pop('distance_count')
+    aggregates = {
+        'per_year': totals['per_year'].astype('int64').sort_index(),
+        'mean_distance_per_year': mean_distance.sort_index(),
+    }
+    for key in ['per_prefecture', 'per_company', 'per_line']:
+        aggregates[key] = totals[key].astype('int64').sort_values(ascending=False)
+    return aggregates
+
+def large_source(path=DATA_PATH):
+    # Sources whose aggregates are streamed, and whose frame only the row-level pages load
+    return os.path.getsize(path) >= STREAM_AGGREGATES_BYTES
+
+@st.cache_data(show_spinner=False, max_entries=4)
+@timed_function()
+def _load_aggregates(path, version):
+    # Asked of the configured query backend; pandas over the loaded frame by default,
+    # or streamed from the sidecar (or the source) when the source is large
+    if configured_backend() == 'pandas' and large_source(path):
+        return stream_aggregates(fresh_sidecar(path) or path)
+    return get_backend(path, version).aggregates()
+
+def load_aggregates(path=DATA_PATH, version=None):
+    # Memoized per dataset version, like load_dataset
+    return _load_aggregates(path, version or dataset_version(path))
+
+def _cumulative_counts(years, column):
+    # (n_years + 1) x n_categories running counts per year, starting from a row of zeros
+    counts = pd.crosstab(years, column)
+    running = np.vstack([np.zeros((1, counts.shape[1]), dtype='int64'), counts.to_numpy().cumsum(axis=0)])
+    return counts.columns, running
+
+@timed_function()
+def build_year_index(df):
+    # Year-sorted stations plus per-year row offsets, so a year range is a plain slice.
+    # A frame that is already in year order (like the shared copy) is used as is rather than copied.
+    # 'cube' holds year x category running counts for each of CUBE_DIMENSIONS, and
+    # 'position_sums'/'position_counts' running Latitude/Longitude sums and non-null counts,
+    # so range totals never touch the rows.
+    if df['Year'].is_monotonic_increasing:
+        frame = df.reset_index(drop=True)
+    else:
+        frame = df.sort_values('Year', kind='stable', ignore_index=True)
+    years = frame['Year'].dt.year.to_numpy()
+    unique_years, year_counts = np.unique(years, return_counts=True)
+    offsets = np.concatenate([[0], np.cumsum(year_counts)])
+    positions = frame[['Latitude', 'Longitude']].to_numpy(dtype='float64', na_value=np.nan)
+    # Missing coordinates add nothing to the sums and aren't counted, like Series.mean skipping NaN
+    position_sums = np.vstack([np.zeros((1, 2)), np.nan_to_num(positions).cumsum(axis=0)])[offsets]
+    position_counts = np.vstack([np.zeros((1, 2), dtype='int64'), (~np.isnan(positions)).cumsum(axis=0)])[offsets]
+    return {
+        'frame': frame,
+        'years': unique_years,
+        'offsets': offsets,
+        'cube': {dimension: _cumulative_counts(years, frame[dimension]) for dimension in CUBE_DIMENSIONS},
+        'position_sums': position_sums,
+        'position_counts': position_counts,
+    }
+
+@st.cache_resource(show_spinner=False, max_entries=FRAME_VERSIONS)
+def _load_year_index(path, version):
+    # Shared read-only between sessions, so nothing should write to it
+    return build_year_index(load_dataset(path, version))
+
+def load_year_index(path=DATA_PATH, version=None):
+    return _load_year_index(path, version or dataset_version(path))
+
+def year_bounds(year_index, start, end):
+    # Positions in year_index['years'] covering start..end inclusive
+    years = year_index['years']
+    return np.searchsorted(years, start, side='left'), np.searchsorted(years, end, side='right')
+
+def year_slice(year_index, start, end):
+    # Stations opened between start and end, as a slice of the sorted frame (no row copy)
+    lo, hi = year_bounds(year_index, start, end)
+    offsets = year_index['offsets']
+    return year_index['frame'].iloc[offsets[lo]:offsets[hi]]
+
+def year_range_counts(year_index, start, end, dimension):
+    # Stations per category of `dimension` opened between start and end, as one row difference
+    lo, hi = year_bounds(year_index, start, end)
+    categories, running = year_index['cube'][dimension]
+    return pd.Series(running[hi] - running[lo], index=categories)
+
+def year_range_summary(year_index, start, end):
+    # Range totals from the prefix sums, without touching the rows
+    lo, hi = year_bounds(year_index, start, end)
+    offsets = year_index['offsets']
+    stations = int(offsets[hi] - offsets[lo])
+    per_company = year_range_counts(year_index, start, end, 'Company')
+    per_line = year_range_counts(year_index, start, end, 'Shinkansen_Line')
+    position_sums = year_index['position_sums'][hi] - year_index['position_sums'][lo]
+    position_counts = year_index['position_counts'][hi] - year_index['position_counts'][lo]
+    return {
+        'stations': stations,
+        'lines': int((per_line > 0).sum()),
+        'companies': int((per_company > 0).sum()),
+        'per_year': pd.Series(np.diff(offsets[lo:hi + 1]), index=year_index['years'][lo:hi]),
+        'per_company': per_company,
+        'per_prefecture': year_range_counts(year_index, start, end, 'Prefecture'),
+        # Mean Latitude/Longitude of the range's known coordinates, NaN when there are none
+        'center': np.divide(position_sums, position_counts, out=np.full(2, np.nan), where=position_counts > 0),
+    }
+
+def top_categories(counts, k=5):
+    # The k largest non-zero counts, ties kept in category order
+    return counts[counts > 0].sort_values(ascending=False, kind='stable').head(k)
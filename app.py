@@ -1,27 +1,45 @@
 import streamlit as st
 import pandas as pd
 from streamlit_navigation_bar import st_navbar
-import matplotlib.pyplot as plt
-import altair as alt
-import plotly.express as px
-import pydeck as pdk
-
-st.set_page_config(
-    page_title="Data Viz Guide",
-    page_icon="random",
-    layout="wide"
+from data import DATA_PATH
+from lazy_imports import import_report, lazy_import
+from charts import (
+    AVG_DISTANCE_SPEC, DENSITY_BINS, SHINKANSEN_GRAPH, avg_distance_data, company_bar_chart, company_pie_chart,
+    map_points, prefecture_bar_figure, scatter_density_png, scatter_sample, station_column_layer, station_scatter_png
 )
+from images import image_variant
+from downsample import SCATTER_POINT_LIMIT, downsample_caption, downsample_series
+from aggregates import top_categories, year_slice, year_range_summary
+from snapshot import current_snapshot, get_refresher
+from prerender import gallery_artifact, start_prerendering
+from backends import get_backend
+from perf import export_timings, perf_page_enabled, reset_timings, timed, timed_function, timing_report
+
+# Processes started by the pre-render pool re-import this script as __mp_main__;
+# only the Streamlit run builds snapshots, starts workers and draws the page
+if __name__ == "__main__":
+    st.set_page_config(
+        page_title="Data Viz Guide",
+        page_icon="random",
+        layout="wide"
+    )
 
-df = pd.read_excel("shinkansen.xlsx")
+    # One consistent view of the data for this whole rerun; new versions are built in the background
+    # The frame and year index are only loaded on first use when the source is large
+    snapshot = current_snapshot()
+    aggregates = snapshot['aggregates']
 
-df['Year'] = pd.to_datetime(df['Year'], format='%Y')
-df['Longitude'] = pd.to_numeric(df['Longitude'])
-df['Latitude'] = pd.to_numeric(df['Latitude'])
+    # Advanced Charts artifacts are rendered in worker processes at startup and after each refresh
+    start_prerendering()
 
+@timed_function('chart.area_chart')
 def area_chart():
     st.subheader("*Number of Stations Opened Per Year*")
-    stations_per_year = df.groupby('Year').size()
+    # Long series are reduced to a pixel-appropriate number of points first
+    stations_per_year, sampling = downsample_series(aggregates['per_year'])
     st.area_chart(stations_per_year, x_label="Year Opened", y_label="Number of Stations", color="#6298c0")
+    if downsample_caption(sampling):
+        st.caption(downsample_caption(sampling))
 
     st.write("**Function Signature**")
     code = '''st.area_chart(data=None, *, x=None, y=None, x_label=None, y_label=None, color=None, stack=None, width=None, height=None, use_container_width=True)'''
@@ -59,9 +77,10 @@ def area_chart():
     st.area_chart(stations_per_year, x_label="Year Opened", y_label="Number of Stations", color="#6298c0")'''
     st.code(code, language="python")
 
+@timed_function('chart.bar_chart')
 def bar_chart():
     st.subheader("*Number of Stations Per Prefecture*")
-    stations_per_prefecture = df['Prefecture'].value_counts()
+    stations_per_prefecture = aggregates['per_prefecture']
     st.bar_chart(stations_per_prefecture, x_label="Prefecture", y_label="Number of Stations", color="#c18489")
 
     st.write("**Function Signature**")
@@ -101,10 +120,14 @@ def bar_chart():
     st.bar_chart(stations_per_prefecture, x_label="Prefecture", y_label="Number of Stations", color="#c18489")'''
     st.code(code, language="python")
 
+@timed_function('chart.line_chart')
 def line_chart():
     st.subheader("*Stations Opened Per Year*")
-    stations_per_year = df.groupby('Year').size()
+    # Long series are reduced to a pixel-appropriate number of points first
+    stations_per_year, sampling = downsample_series(aggregates['per_year'])
     st.line_chart(stations_per_year, x_label="Year Opened", y_label="Number of Stations", color="#6298c0")
+    if downsample_caption(sampling):
+        st.caption(downsample_caption(sampling))
 
     st.write("**Function Signature**")
     code = '''st.line_chart(data=None, *, x=None, y=None, x_label=None, y_label=None, color=None, width=None, height=None, use_container_width=True)'''
@@ -141,9 +164,28 @@ def line_chart():
     st.line_chart(stations_per_year, x_label="Year Opened", y_label="Number of Stations", color="#6298c0")'''
     st.code(code, language="python")
 
+@st.fragment
+def scatter_panel(snapshot):
+    # Past SCATTER_POINT_LIMIT rows, either send a density-preserving sample or a server-side image.
+    # Flipping the render toggle reruns only this panel.
+    rasterize = len(snapshot['frame']) > SCATTER_POINT_LIMIT and st.toggle("Render as a density image on the server")
+    if rasterize:
+        png, points = scatter_density_png(DATA_PATH, snapshot['version'], "Station Name", "Distance from Tokyo Station",
+                                          x_label="Station Name", y_label="Distance from Tokyo Station (km)")
+        st.image(png, use_container_width=True)
+        st.caption(f"All {points:,} stations with a distance counted into a {DENSITY_BINS[0]}×{DENSITY_BINS[1]} grid and drawn as one image")
+    else:
+        # Only the plotted columns are sent
+        scatter_data, sampling = scatter_sample(DATA_PATH, snapshot['version'], "Station Name", "Distance from Tokyo Station",
+                                                ("Station Name", "Distance from Tokyo Station", "Company"), SCATTER_POINT_LIMIT)
+        st.scatter_chart(scatter_data, x="Station Name", y="Distance from Tokyo Station", x_label="Station Name", y_label="Distance from Tokyo Station (km)", size="Company", color="#c7daed")
+        if downsample_caption(sampling):
+            st.caption(downsample_caption(sampling))
+
+@timed_function('chart.scatter_plot')
 def scatter_plot():
     st.subheader("*Distance from Tokyo Station*")
-    st.scatter_chart(df, x="Station Name", y="Distance from Tokyo Station", x_label="Station Name", y_label="Distance from Tokyo Station (km)", size="Company", color="#c7daed")
+    scatter_panel(snapshot)
 
     st.write("**Function Signature**")
     code = '''st.scatter_chart(data=None, *, x=None, y=None, x_label=None, y_label=None, color=None, size=None, width=None, height=None, use_container_width=True)'''
@@ -178,9 +220,12 @@ def scatter_plot():
     st.scatter_chart(df, x="Station Name", y="Distance from Tokyo Station", x_label="Station Name", y_label="Distance from Tokyo Station (km)", size="Company", color="#c7daed")'''
     st.code(code, language="python")
 
+@timed_function('chart.map')
 def map():
     st.subheader("*Shinkansen Stations in Japan*")
-    st.map(df, longitude="Longitude", latitude="Latitude", color="#87bbe2")
+    # Large datasets are binned into grid cells server-side before they reach the browser
+    points = map_points(snapshot['frame'], zoom=5)
+    st.map(points, longitude="Longitude", latitude="Latitude", color="#87bbe2", size="size" if "size" in points else None)
 
     st.write("**Function Signature**")
     code = '''st.map(data=None, *, latitude=None, longitude=None, color=None, size=None, zoom=None, use_container_width=True)'''
@@ -212,30 +257,13 @@ def map():
     st.map(df, longitude="Longitude", latitude="Latitude", color="#87bbe2")'''
     st.code(code, language="python")
     
+@timed_function('chart.matplotlib_fig')
 def matplotlib_fig():
-    custom_colors = ['#c18489', '#e3a8b3', '#87bbe2', '#c7daed', '#6298c0']
-    shinkansen_lines = df['Shinkansen_Line'].unique()
-    color_map = {line: custom_colors[i % len(custom_colors)] for i, line in enumerate(shinkansen_lines)}
-
-
-    # Create a scatter plot
-    plt.figure(figsize=(6, 4))
-    for line in shinkansen_lines:
-        subset = df[df['Shinkansen_Line'] == line]
-        plt.scatter(
-            subset['Longitude'], subset['Latitude'], 
-            alpha=0.7, label=line, 
-            edgecolors='w', s=30, 
-            c=color_map[line]
-        )
-
-    plt.title('Shinkansen Stations in Japan')
-    plt.xlabel('Longitude')
-    plt.ylabel('Latitude')
-    plt.grid(True)
-
-    # Display the plot in Streamlit
-    st.pyplot(plt)
+    # Pre-rendered PNG from the worker pool, or cached PNG bytes rendered here if it isn't ready yet
+    png = gallery_artifact(DATA_PATH, snapshot, 'Matplotlib')
+    if png is None:
+        png = station_scatter_png(DATA_PATH, snapshot['version'], figsize=(6, 4))
+    st.image(png, use_container_width=True)
 
     st.write("**Function Signature**")
     code = '''st.pyplot(fig=None, clear_figure=None, use_container_width=True, **kwargs)'''
@@ -288,32 +316,14 @@ def matplotlib_fig():
 
     st.write('''To learn more, visit the documentation: https://matplotlib.org/stable/index.html''')
 
+@timed_function('chart.altair_fig')
 def altair_fig():
-    company_counts = df['Company'].value_counts().reset_index()
-    company_counts.columns = ['Company', 'Number of Stations']
-
-    # Customize the colors
-    custom_colors = ['#c18489', '#e3a8b3', '#87bbe2', '#c7daed', '#6298c0']
-    company_list = company_counts['Company'].unique()
-    color_map = {company: custom_colors[i % len(custom_colors)] for i, company in enumerate(company_list)}
-    
-    # Convert the color map to a scale for Altair
-    color_scale = alt.Scale(domain=list(color_map.keys()), range=list(color_map.values()))
-    
-    # Create a bar chart using Altair
-    chart = alt.Chart(company_counts).mark_bar().encode(
-        x=alt.X('Company:N', sort='-y', title='Company'),
-        y=alt.Y('Number of Stations:Q', title='Number of Stations'),
-        color=alt.Color('Company:N', scale=color_scale),
-        tooltip=['Company:N', 'Number of Stations:Q']
-    ).properties(
-        title='Number of Shinkansen Stations by Company',
-        width=600,
-        height=400
-    )
-
-    # Display the chart in Streamlit
-    st.altair_chart(chart)
+    # Pre-rendered Vega-Lite spec from the worker pool, else built once per version in the chart cache
+    spec = gallery_artifact(DATA_PATH, snapshot, 'Altair')
+    if spec is not None:
+        st.vega_lite_chart(spec)
+    else:
+        st.altair_chart(company_bar_chart(DATA_PATH, snapshot['version']))
 
     st.write("**Function Signature**")
     code = '''st.altair_chart(altair_chart, *, use_container_width=False, theme="streamlit", key=None, on_select="ignore", selection_mode=None)'''
@@ -370,29 +380,12 @@ def altair_fig():
 
     st.write('''To learn more, visit the documentation: https://altair-viz.github.io''')
 
+@timed_function('chart.vega_fig')
 def vega_fig():
-    avg_distance_per_year = df.groupby('Year')['Distance from Tokyo Station'].mean().reset_index()
-    avg_distance_per_year.columns = ['Year', 'Average Distance']
+    avg_distance_per_year = avg_distance_data(aggregates)
 
-    # Create a line chart using Vega-Lite
-    chart = {
-        "data": {
-            "values": avg_distance_per_year.to_dict(orient="records")
-        },
-        "mark": {
-            "type":"line",
-            "color": "#c18489"
-        },
-        "encoding": {
-            "x": {"field": "Year", "type": "temporal", "title": "Year"},
-            "y": {"field": "Average Distance", "type": "quantitative", "title": "Average Distance (km)"},
-            "tooltip": [{"field": "Year", "type": "temporal"}, {"field": "Average Distance", "type": "quantitative"}]
-        },
-        "title": "Average Distance from Tokyo Station by Year"
-    }
-
-    # Display the chart in Streamlit
-    st.vega_lite_chart(chart, use_container_width=True)
+    # The spec is a prebuilt constant; the DataFrame is sent through Streamlit's Arrow data channel
+    st.vega_lite_chart(avg_distance_per_year, AVG_DISTANCE_SPEC, use_container_width=True)
 
     st.write("**Function Signature**")
     code = '''st.vega_lite_chart(data=None, spec=None, *, use_container_width=False, theme="streamlit", key=None, on_select="ignore", selection_mode=None, **kwargs)'''
@@ -448,36 +441,12 @@ def vega_fig():
 
     st.write('''To learn more, visit the documentation: https://vega.github.io/vega-lite/docs/''')
 
+@timed_function('chart.plotly_fig')
 def plotly_fig():
-    # Customize the colors
-    custom_colors = ['#c18489', '#e3a8b3', '#87bbe2', '#c7daed', '#6298c0']
-
-    prefecture_counts = df['Prefecture'].value_counts().reset_index()
-    prefecture_counts.columns = ['Prefecture', 'Number of Stations']
-
-    
-    # Map each prefecture to a custom color
-    prefecture_list = prefecture_counts['Prefecture'].unique()
-    color_map = {prefecture: custom_colors[i % len(custom_colors)] for i, prefecture in enumerate(prefecture_list)}
-    
-    # Create a bar chart using Plotly
-    fig = px.bar(
-        prefecture_counts,
-        x='Prefecture',
-        y='Number of Stations',
-        color='Prefecture',
-        title='Number of Shinkansen Stations by Prefecture',
-        labels={'Prefecture': 'Prefecture', 'Number of Stations': 'Number of Stations'},
-        height=600,
-        color_discrete_map=color_map  # Apply the custom colors
-    )
-
-    # Customize the layout for better readability
-    fig.update_layout(
-        xaxis_title='Prefecture',
-        yaxis_title='Number of Stations',
-        xaxis={'categoryorder':'total descending'}
-    )
+    # Pre-rendered figure JSON from the worker pool, else built once per version in the chart cache
+    fig = gallery_artifact(DATA_PATH, snapshot, 'Plotly')
+    if fig is None:
+        fig = prefecture_bar_figure(DATA_PATH, snapshot['version'])
 
     # Display the chart in Streamlit
     st.plotly_chart(fig, use_container_width=True)
@@ -548,18 +517,10 @@ def plotly_fig():
 def bokeh_fig():
     st.write("Working on it...")
 
+@timed_function('chart.pydeck_fig')
 def pydeck_fig():
-    layer = pdk.Layer(
-        'ColumnLayer',
-        data=df,
-        get_position='[Longitude, Latitude]',
-        get_elevation=1000,  # Fixed elevation for all stations, can be modified to use a data field
-        elevation_scale=50,
-        radius=10000,  # Adjust the radius of the columns
-        get_fill_color='[98, 152, 192, 255]',   # RGBA color format
-        pickable=True,  # Enable picking for interactivity
-        auto_highlight=True
-    )
+    pdk = lazy_import('pydeck')
+    df = snapshot['frame']
 
     # Set the view of the map
     view_state = pdk.ViewState(
@@ -569,11 +530,14 @@ def pydeck_fig():
         pitch=50,  # Tilt the map for a 3D effect
     )
 
+    # One column per station, or per grid cell sized for the initial zoom on large data
+    layer, tooltip = station_column_layer(df, zoom=view_state.zoom)
+
     # Create the pydeck chart
     r = pdk.Deck(
         layers=[layer],
         initial_view_state=view_state,
-        tooltip={"text": "Station: {Station Name}\nPrefecture: {Prefecture}\nLine: {Shinkansen_Line}"}
+        tooltip=tooltip
     )
 
     st.subheader("**3D Map of Shinkansen Stations in Japan**")
@@ -638,33 +602,14 @@ def pydeck_fig():
 
     st.write('''To learn more, visit the documentation: https://deckgl.readthedocs.io/en/latest/''')
 
+@timed_function('chart.graphviz_fig')
 def graphviz_fig():
-    graph = '''
-    digraph G {
-        rankdir=LR;
-        
-        Tokaido_Shinkansen [label="Tokaido Shinkansen", shape=box, style=filled, color="#c18489"];
-        Sanyo_Shinkansen [label="Sanyo Shinkansen", shape=box, style=filled, color="#87bbe2"];
-        Tohoku_Shinkansen [label="Tohoku Shinkansen", shape=box, style=filled, color="#6298c0"];
-        
-        Tokyo [label="Tokyo Station", shape=ellipse];
-        Shin_Yokohama [label="Shin-Yokohama Station", shape=ellipse];
-        Kyoto [label="Kyoto Station", shape=ellipse];
-        Osaka [label="Osaka Station", shape=ellipse];
-        Sendai [label="Sendai Station", shape=ellipse];
-        
-        Tokaido_Shinkansen -> Tokyo;
-        Tokaido_Shinkansen -> Shin_Yokohama;
-        Tokaido_Shinkansen -> Kyoto;
-        Sanyo_Shinkansen -> Kyoto;
-        Sanyo_Shinkansen -> Osaka;
-        Tohoku_Shinkansen -> Tokyo;
-        Tohoku_Shinkansen -> Sendai;
-    }
-    '''
-
-    # Display the graph using st.graphviz_chart
-    st.graphviz_chart(graph)
+    # Pre-rendered SVG when Graphviz is installed on the server, else drawn in the browser
+    svg = gallery_artifact(DATA_PATH, snapshot, 'Graphviz')
+    if svg:
+        st.image(svg)
+    else:
+        st.graphviz_chart(SHINKANSEN_GRAPH)
 
     st.write("**Function Signature**")
     code = '''st.graphviz_chart(figure_or_dot, use_container_width=False)'''
@@ -717,281 +662,307 @@ def graphviz_fig():
 
     st.write('''To learn more, visit the documentation: https://graphviz.org/documentation/''')
 
-styles = {
-    "nav": {
-        "background-color": "rgb(255, 227, 232)",
-    }
-}
-
-page = st_navbar(["Demo Dashboard", "Simple Charts", "Advanced Charts", "Other"], styles=styles)
-
-if page == "Simple Charts":
-    st.header('Streamlit Data Viz Guide')
-    choice = st.selectbox('Choose a chart type', options=['Area Chart', 'Bar Chart', 'Line Chart', 'Scatter Plot', 'Map'], index=None, key=1)
-    st.write('###')
-
-    if choice == "Area Chart":
-        area_chart()
-    elif choice == "Bar Chart":
-        bar_chart()
-    elif choice == "Line Chart":
-        line_chart()
-    elif choice == "Scatter Plot":
-        scatter_plot()
-    elif choice == "Map":
-        map()
-    else:
-        st.subheader("Pros and Cons of Simple Charts")
-        st.write('''*"Simple charts" are data visualization tools native to Streamlit.*''')
-        st.markdown(
-            """
-            **Pros**:
-            - **Simplicity**: Streamlit's native charts are straightforward to use with minimal code. They are ideal for quickly adding visualizations to your app.
-            - **Easy Integration**: These charts are fully integrated with Streamlit, meaning they handle reactivity (e.g., updates when data changes) and layout automatically.
-            - **Performance**: Native charts are optimized for performance within Streamlit, ensuring quick rendering and smooth user experience.
-            - **Low Learning Curve**: For users who are new to data visualization or want to get something on the screen quickly, native Streamlit charts are very accessible.
-            """
-        )
-        st.markdown(
-            """
-            **Cons**:
-            - **Limited Customization**: Native charts lack the advanced customization options available in more powerful libraries. If you need complex formatting or highly specific visual elements, they might not be sufficient.
-            - **Fewer Choices**: The range of chart types and options is more limited compared to external libraries like Plotly or Matplotlib.
-            - **Basic Interactivity**: While Streamlit charts support basic interactivity, they don’t offer the advanced interactive features available in other libraries.
-            """
-        )
-        st.markdown('''
-            <style>
-            [data-testid="stMarkdownContainer"] ul{
-                padding-left:40px;
-            }
-            </style>
-        ''', unsafe_allow_html=True)
-
-        st.subheader("My Data")
-        st.write("My dataset is a Japanese bullet train (shinkansen) dataset from Kaggle and I used pandas to import/manipulate it.")
-        st.code('''df = pd.read_excel("shinkansen.xlsx")''', language="python")
-
-elif page == "Advanced Charts":
-    st.header('Streamlit Data Viz Guide')
-    choice = st.selectbox('Choose a chart type', options=['Matplotlib', 'Altair', 'Vega Lite', 'Plotly', 'Pydeck', 'Graphviz'], index=None, key=2)
-    st.write('###')
-
-    if choice == "Matplotlib":
-        matplotlib_fig()
-    elif choice == 'Altair':
-        altair_fig()
-    elif choice == 'Vega Lite':
-        vega_fig()
-    elif choice == 'Plotly':
-        plotly_fig()
-    elif choice == 'Pydeck':
-        pydeck_fig()
-    elif choice == "Graphviz":
-        graphviz_fig()
-    else:
-        st.subheader("Pros and Cons of Advanced Charts")
-        st.write('''*"Advanced charts" are data visualization tools from other Python packages/libraries such as Matplotlib or Plotly.*''')
-        st.markdown(
-            """
-            **Pros**:
-            - **Many Customization Options**: These libraries offer extensive customization options for every aspect of your charts, including styling, labeling, and layout.
-            - **Wide Variety of Chart Types**: Libraries like Plotly and Matplotlib provide a broad range of chart types, from basic to highly specialized visualizations.
-            - **Advanced Interactivity**: Some tools offer robust interactive features like hover effects, zooming, and clicking, making them ideal for complex, interactive dashboards.
-            - **Publication-Ready Quality**: These tools can produce publication-quality figures, which is important for professional presentations or reports.
-            - **Community Support and Extensions**: Being widely used in the data science community, these libraries have extensive documentation, community support, and numerous plugins/extensions.
-            """
-        )
-        st.markdown(
-            """
-            **Cons**:
-            - **Steeper Learning Curve**: These tools require more effort to learn and use effectively, especially for complex customizations.
-            - **Additional Dependencies**: Using these libraries requires installing additional packages, which might add to your app's dependencies.
-            - **Potential Performance Overhead**: Advanced libraries, particularly with complex or interactive charts, can introduce performance overhead, which might slow down your app, especially with large datasets.
-            - **Integration Complexity**: You might need to handle some integration aspects manually, such as ensuring reactivity or properly managing layout within your Streamlit app.
-            """
-        )
-        st.markdown('''
-            <style>
-            [data-testid="stMarkdownContainer"] ul{
-                padding-left:40px;
-            }
-            </style>
-        ''', unsafe_allow_html=True)
-
-        st.subheader("My Data")
-        st.write("My dataset is a Japanese bullet train (shinkansen) dataset from Kaggle and I used pandas to import/manipulate it.")
-        st.code('''df = pd.read_excel("shinkansen.xlsx")''', language="python")
-
-elif page == "Other":
-    st.subheader("Honorable Mentions")
-    st.write("*A brief overview of other Streamlit widgets and elements that can be utilized for data visualization*")
-    col1, col2 = st.columns(2)
-
-    with col1.expander("**Text Elements**", expanded=True):
-        st.title("This is a title.")
-        st.code('''st.title("This is a title.")''', language="Python")
-        st.divider()
-
-        st.header("This is a header.")
-        st.code('''st.header("This is a header.")''', language="Python")
-        st.divider()
-
-        st.subheader("This is a subheader.")
-        st.code('''st.subheader("This is a subheader.")''', language="Python")
-
-    with col2.expander("**Data Elements**", expanded=True):
-        d = {'Song': ["Tear", "Paranoia", "Move"], 'Artist': ["BTS", "KANGDANIEL", "Taemin"]}
-        song_df = pd.DataFrame(d)
-        st.dataframe(song_df, hide_index=True)
-        st.code('''st.dataframe(song_df, hide_index=True)''', language="python")
-        st.divider()
-
-        d = {'Show': ["Teen Wolf", "The Walking Dead", "Percy Jackson"], 'Release Year': [2011, 2010, 2024]}
-        tv_df = pd.DataFrame(d)
-        st.table(tv_df)
-        st.code('''st.table(tv_df)''', language="python")
-        st.divider()
-
-        d = {'Japanese Artist': ["Chanmina", "Fujii Kaze", "ATARASHII GAKKO!"], 'Song': ["Harenchi", "Shinunoga E-Wa", "Otonablue"]}
-        song_df = pd.DataFrame(d)
-        song_df['Favorite?'] = False
-        st.data_editor(song_df, disabled=['Song', 'Japanese Artist'], hide_index=True)
-        st.code('''st.data_editor(song_df, disabled=['Song', 'Japanese Artist'], hide_index=True)''', language="python")
-        st.divider()
-
-        st.metric("Songs in Playlist", 774, 2)
-        st.code('''st.metric("Songs in Playlist", 774, 2)''', language="python")
-
-    with col1.expander("**Input Widgets**", expanded=True):
-        on = st.toggle("Click me if you dare!")
-        if on:
-            st.toast("Wow, I never saw that coming.", icon="😝")
-        st.code('''st.toggle("Click me if you dare!")''', language="python")
-        st.divider()
-
-        st.radio("Choose a game:", options=["Animal Crossing", "Mario Kart", "Kirby"])
-        st.code('''st.radio("Choose a game:", options=["Animal Crossing", "Mario Kart", "Kirby"])''', language="python")
-        st.divider()
-
-        st.selectbox("Select a movie", options=["Zombieland", "White Chicks", "Spirited Away"])
-        st.code('''st.selectbox("Select a movie", options=["Zombieland", "White Chicks", "Spirited Away"])''', language="python")
-        st.divider()
-
-        st.multiselect("Choose all pets that apply", options=["Cat", "Dog", "Fish", "Hamster", "Other"])
-        st.code('''st.multiselect("Choose all pets that apply", options=["Cat", "Dog", "Fish", "Hamster", "Other"])''', language="python")
-        st.divider()
-
-        st.slider('Pick a rating',1, 5)
-        st.code('''st.slider('Pick a rating', 1, 5)''', language="python")
-        st.divider()
-
-        bday = st.date_input('Select your birthday', value=None, format="MM/DD/YYYY")
-        if bday is not None:
-            st.balloons()
-        st.code('''st.date_input('Select your birthday', value=None, format="MM/DD/YYYY")''', language="python")
-
-    with col2.expander("**Media Elements**", expanded=True):
-        st.image("deer.png")
-        st.code('''st.image("deer.png")''', language="python")
-        st.divider()
-        st.code('''st.logo(your_logo)''', language="python")
-        
-
-
-else:
-    st.header("**Shinkansen in Japan 🚅**")
-    st.markdown("---")
+@st.fragment
+def year_panels(snapshot, col1, map_slot, col3):
+    # Dashboard panels that depend on the selected years. Moving the slider reruns only this
+    # fragment, against the snapshot of the last full run; the header and image are left alone.
+    pdk = lazy_import('pydeck')
 
-    col1, col2, col3 = st.columns([1.5, 4.5, 2], gap='medium')
+    year_index = snapshot['year_index']
+    first_year, last_year = int(year_index['years'][0]), int(year_index['years'][-1])
 
-    selected_year = col1.slider("Filter by Year", min_value=df['Year'].dt.year.min(), max_value=df['Year'].dt.year.max(), value=(df['Year'].dt.year.min(), df['Year'].dt.year.max()), step=10)
+    selected_year = col1.slider("Filter by Year", min_value=first_year, max_value=last_year, value=(first_year, last_year), step=10)
 
-    df['Year'] = df['Year'].dt.year
-    df = df[(df['Year'] >= selected_year[0]) & (df['Year'] <= selected_year[1])]
+    with timed('dashboard.year_filter'):
+        # Slice of the year-sorted stations plus range totals from prefix sums
+        year_df = year_slice(year_index, *selected_year)
+        year_summary = year_range_summary(year_index, *selected_year)
+        stations_per_year = year_summary['per_year']
 
+        most_recent_year = stations_per_year.index.max()
+        previous_year = '2016'
+        
+        stations_most_recent = stations_per_year.get(most_recent_year, 0)
+        stations_previous = stations_per_year.get(previous_year, 0)
 
+        # Calculate the difference
+        station_delta = stations_most_recent - stations_previous
 
-    most_recent_year = df['Year'].max()
-    previous_year = '2016'
-    
-    stations_most_recent = df[df['Year'] == most_recent_year]['Station Name'].count()
-    stations_previous = df[df['Year'] == previous_year]['Station Name'].count()
-
-    # Calculate the difference
-    station_delta = stations_most_recent - stations_previous
-
-    with col1:
+    with timed('dashboard.metrics'), col1:
         with st.container(border=True):
-            st.metric("*Stations*", df['Station Name'].count(), delta=int(station_delta))
+            st.metric("*Stations*", year_summary['stations'], delta=int(station_delta))
         with st.container(border=True):
-            st.metric("*Train Lines*", df['Shinkansen_Line'].nunique())
+            st.metric("*Train Lines*", year_summary['lines'])
         with st.container(border=True):
-            st.metric("*Companies*", df['Company'].nunique())
-
-        # Create the pie chart
-        color_scale = alt.Scale(domain=['JR Central', 'JR East', 'JR West', 'JR Kyushu', 'JR Hokkaido'], 
-                            range=['#c18489', '#e3a8b3', '#87bbe2', '#c7daed', '#6298c0'])
-        pie_data = df.groupby(['Company']).size().reset_index(name='# of Stations')
-        pie_chart = alt.Chart(pie_data).mark_arc().encode(
-            theta=alt.Theta('# of Stations:Q', stack=True),
-            color=alt.Color('Company:N', scale=color_scale, legend=None),
-            tooltip=['Company:N', '# of Stations:Q']
-        ).properties(
-            width=150,  # Set width
-            height=150
-        )
+            st.metric("*Companies*", year_summary['companies'])
+
+        # Pie chart for the selected years, reused from the chart cache
+        pie_chart = company_pie_chart(DATA_PATH, snapshot['version'], selected_year)
 
         st.write('*Stations Per Company*')
         st.altair_chart(pie_chart)
 
-    layer = pdk.Layer(
-        'ColumnLayer',
-        data=df,
-        get_position='[Longitude, Latitude]',
-        get_elevation=1000,  # Fixed elevation for all stations, can be modified to use a data field
-        elevation_scale=50,
-        radius=10000,  # Adjust the radius of the columns
-        get_fill_color='[98, 152, 192, 255]',  # RGBA color format
-        pickable=True,  # Enable picking for interactivity
-        auto_highlight=True
-    )
+    with timed('dashboard.map'):
+        # Set the view of the map
+        # Centered on the range's mean position, from the year index's running sums
+        latitude, longitude = year_summary['center']
+        view_state = pdk.ViewState(
+            latitude=latitude,
+            longitude=longitude,
+            zoom=5,
+            pitch=50,  # Tilt the map for a 3D effect
+        )
 
-    # Set the view of the map
-    view_state = pdk.ViewState(
-        latitude=df['Latitude'].mean(),
-        longitude=df['Longitude'].mean(),
-        zoom=5,
-        pitch=50,  # Tilt the map for a 3D effect
-    )
+        # One column per station, or per grid cell sized for the initial zoom on large data
+        layer, tooltip = station_column_layer(year_df, zoom=view_state.zoom)
 
-    # Create the pydeck chart
-    r = pdk.Deck(
-        layers=[layer],
-        initial_view_state=view_state,
-        map_style='mapbox://styles/mapbox/light-v10',
-        tooltip={"text": "Station: {Station Name}\nPrefecture: {Prefecture}\nLine: {Shinkansen_Line}"}
-    )
+        # Create the pydeck chart
+        r = pdk.Deck(
+            layers=[layer],
+            initial_view_state=view_state,
+            map_style='mapbox://styles/mapbox/light-v10',
+            tooltip=tooltip
+        )
+
+        #map_slot.subheader("**3D Map of Shinkansen Stations in Japan**")
+        map_slot.pydeck_chart(r)
+
+    with timed('dashboard.top_prefectures'):
+        # Top 5 prefectures straight from the year x Prefecture counts
+        top_5_prefectures = top_categories(year_summary['per_prefecture'], k=5)
+        heatmap_data = top_5_prefectures.rename_axis('Prefecture').reset_index(name='# of Stations')
+
+        col3.subheader('*Top Prefectures*')
+        col3.dataframe(heatmap_data, hide_index=True, use_container_width=True)
+
+    with timed('dashboard.stations_per_year'):
+        col3.subheader("*Stations Per Year*")
+        stations_per_year, sampling = downsample_series(stations_per_year)
+        stations_per_year.index = stations_per_year.index.astype(str)
+        col3.line_chart(stations_per_year, x_label="Year Opened", y_label="Number of Stations", color="#6298c0")
+        if downsample_caption(sampling):
+            col3.caption(downsample_caption(sampling))
+
+@st.fragment
+def input_widgets():
+    # Playing with these demo widgets reruns only this expander
+    on = st.toggle("Click me if you dare!")
+    if on:
+        st.toast("Wow, I never saw that coming.", icon="😝")
+    st.code('''st.toggle("Click me if you dare!")''', language="python")
+    st.divider()
+
+    st.radio("Choose a game:", options=["Animal Crossing", "Mario Kart", "Kirby"])
+    st.code('''st.radio("Choose a game:", options=["Animal Crossing", "Mario Kart", "Kirby"])''', language="python")
+    st.divider()
+
+    st.selectbox("Select a movie", options=["Zombieland", "White Chicks", "Spirited Away"])
+    st.code('''st.selectbox("Select a movie", options=["Zombieland", "White Chicks", "Spirited Away"])''', language="python")
+    st.divider()
+
+    st.multiselect("Choose all pets that apply", options=["Cat", "Dog", "Fish", "Hamster", "Other"])
+    st.code('''st.multiselect("Choose all pets that apply", options=["Cat", "Dog", "Fish", "Hamster", "Other"])''', language="python")
+    st.divider()
+
+    st.slider('Pick a rating',1, 5)
+    st.code('''st.slider('Pick a rating', 1, 5)''', language="python")
+    st.divider()
+
+    bday = st.date_input('Select your birthday', value=None, format="MM/DD/YYYY")
+    if bday is not None:
+        st.balloons()
+    st.code('''st.date_input('Select your birthday', value=None, format="MM/DD/YYYY")''', language="python")
+
+if __name__ == "__main__":
+    styles = {
+        "nav": {
+            "background-color": "rgb(255, 227, 232)",
+        }
+    }
 
-    #col2.subheader("**3D Map of Shinkansen Stations in Japan**")
-    col2.pydeck_chart(r)
+    pages = ["Demo Dashboard", "Simple Charts", "Advanced Charts", "Other"]
+    if perf_page_enabled():
+        pages.append("Performance")
+
+    page = st_navbar(pages, styles=styles)
+
+    if page == "Simple Charts":
+        st.header('Streamlit Data Viz Guide')
+        choice = st.selectbox('Choose a chart type', options=['Area Chart', 'Bar Chart', 'Line Chart', 'Scatter Plot', 'Map'], index=None, key=1)
+        st.write('###')
+
+        if choice == "Area Chart":
+            area_chart()
+        elif choice == "Bar Chart":
+            bar_chart()
+        elif choice == "Line Chart":
+            line_chart()
+        elif choice == "Scatter Plot":
+            scatter_plot()
+        elif choice == "Map":
+            map()
+        else:
+            st.subheader("Pros and Cons of Simple Charts")
+            st.write('''*"Simple charts" are data visualization tools native to Streamlit.*''')
+            st.markdown(
+                """
+                **Pros**:
+                - **Simplicity**: Streamlit's native charts are straightforward to use with minimal code. They are ideal for quickly adding visualizations to your app.
+                - **Easy Integration**: These charts are fully integrated with Streamlit, meaning they handle reactivity (e.g., updates when data changes) and layout automatically.
+                - **Performance**: Native charts are optimized for performance within Streamlit, ensuring quick rendering and smooth user experience.
+                - **Low Learning Curve**: For users who are new to data visualization or want to get something on the screen quickly, native Streamlit charts are very accessible.
+                """
+            )
+            st.markdown(
+                """
+                **Cons**:
+                - **Limited Customization**: Native charts lack the advanced customization options available in more powerful libraries. If you need complex formatting or highly specific visual elements, they might not be sufficient.
+                - **Fewer Choices**: The range of chart types and options is more limited compared to external libraries like Plotly or Matplotlib.
+                - **Basic Interactivity**: While Streamlit charts support basic interactivity, they don’t offer the advanced interactive features available in other libraries.
+                """
+            )
+            st.markdown('''
+                <style>
+                [data-testid="stMarkdownContainer"] ul{
+                    padding-left:40px;
+                }
+                </style>
+            ''', unsafe_allow_html=True)
+
+            st.subheader("My Data")
+            st.write("My dataset is a Japanese bullet train (shinkansen) dataset from Kaggle and I used pandas to import/manipulate it.")
+            st.code('''df = pd.read_excel("shinkansen.xlsx")''', language="python")
+
+    elif page == "Advanced Charts":
+        st.header('Streamlit Data Viz Guide')
+        choice = st.selectbox('Choose a chart type', options=['Matplotlib', 'Altair', 'Vega Lite', 'Plotly', 'Pydeck', 'Graphviz'], index=None, key=2)
+        st.write('###')
+
+        if choice == "Matplotlib":
+            matplotlib_fig()
+        elif choice == 'Altair':
+            altair_fig()
+        elif choice == 'Vega Lite':
+            vega_fig()
+        elif choice == 'Plotly':
+            plotly_fig()
+        elif choice == 'Pydeck':
+            pydeck_fig()
+        elif choice == "Graphviz":
+            graphviz_fig()
+        else:
+            st.subheader("Pros and Cons of Advanced Charts")
+            st.write('''*"Advanced charts" are data visualization tools from other Python packages/libraries such as Matplotlib or Plotly.*''')
+            st.markdown(
+                """
+                **Pros**:
+                - **Many Customization Options**: These libraries offer extensive customization options for every aspect of your charts, including styling, labeling, and layout.
+                - **Wide Variety of Chart Types**: Libraries like Plotly and Matplotlib provide a broad range of chart types, from basic to highly specialized visualizations.
+                - **Advanced Interactivity**: Some tools offer robust interactive features like hover effects, zooming, and clicking, making them ideal for complex, interactive dashboards.
+                - **Publication-Ready Quality**: These tools can produce publication-quality figures, which is important for professional presentations or reports.
+                - **Community Support and Extensions**: Being widely used in the data science community, these libraries have extensive documentation, community support, and numerous plugins/extensions.
+                """
+            )
+            st.markdown(
+                """
+                **Cons**:
+                - **Steeper Learning Curve**: These tools require more effort to learn and use effectively, especially for complex customizations.
+                - **Additional Dependencies**: Using these libraries requires installing additional packages, which might add to your app's dependencies.
+                - **Potential Performance Overhead**: Advanced libraries, particularly with complex or interactive charts, can introduce performance overhead, which might slow down your app, especially with large datasets.
+                - **Integration Complexity**: You might need to handle some integration aspects manually, such as ensuring reactivity or properly managing layout within your Streamlit app.
+                """
+            )
+            st.markdown('''
+                <style>
+                [data-testid="stMarkdownContainer"] ul{
+                    padding-left:40px;
+                }
+                </style>
+            ''', unsafe_allow_html=True)
+
+            st.subheader("My Data")
+            st.write("My dataset is a Japanese bullet train (shinkansen) dataset from Kaggle and I used pandas to import/manipulate it.")
+            st.code('''df = pd.read_excel("shinkansen.xlsx")''', language="python")
+
+    elif page == "Other":
+        st.subheader("Honorable Mentions")
+        st.write("*A brief overview of other Streamlit widgets and elements that can be utilized for data visualization*")
+        col1, col2 = st.columns(2)
+
+        with col1.expander("**Text Elements**", expanded=True):
+            st.title("This is a title.")
+            st.code('''st.title("This is a title.")''', language="Python")
+            st.divider()
+
+            st.header("This is a header.")
+            st.code('''st.header("This is a header.")''', language="Python")
+            st.divider()
+
+            st.subheader("This is a subheader.")
+            st.code('''st.subheader("This is a subheader.")''', language="Python")
+
+        with col2.expander("**Data Elements**", expanded=True):
+            d = {'Song': ["Tear", "Paranoia", "Move"], 'Artist': ["BTS", "KANGDANIEL", "Taemin"]}
+            song_df = pd.DataFrame(d)
+            st.dataframe(song_df, hide_index=True)
+            st.code('''st.dataframe(song_df, hide_index=True)''', language="python")
+            st.divider()
+
+            d = {'Show': ["Teen Wolf", "The Walking Dead", "Percy Jackson"], 'Release Year': [2011, 2010, 2024]}
+            tv_df = pd.DataFrame(d)
+            st.table(tv_df)
+            st.code('''st.table(tv_df)''', language="python")
+            st.divider()
+
+            d = {'Japanese Artist': ["Chanmina", "Fujii Kaze", "ATARASHII GAKKO!"], 'Song': ["Harenchi", "Shinunoga E-Wa", "Otonablue"]}
+            song_df = pd.DataFrame(d)
+            song_df['Favorite?'] = False
+            st.data_editor(song_df, disabled=['Song', 'Japanese Artist'], hide_index=True)
+            st.code('''st.data_editor(song_df, disabled=['Song', 'Japanese Artist'], hide_index=True)''', language="python")
+            st.divider()
+
+            st.metric("Songs in Playlist", 774, 2)
+            st.code('''st.metric("Songs in Playlist", 774, 2)''', language="python")
+
+        with col1.expander("**Input Widgets**", expanded=True):
+            input_widgets()
+
+        with col2.expander("**Media Elements**", expanded=True):
+            # Downscaled WebP instead of the 4 MB original
+            st.image(image_variant("deer.png", width=800))
+            st.code('''st.image("deer.png")''', language="python")
+            st.divider()
+            st.code('''st.logo(your_logo)''', language="python")
+        
 
-    heatmap_data = df.groupby(['Prefecture']).size().reset_index(name='station_count')
-    prefecture_totals = heatmap_data.groupby('Prefecture')['station_count'].sum().reset_index()
 
-    top_5_prefectures = prefecture_totals.sort_values(by='station_count', ascending=False).head(5)['Prefecture']
+    elif page == "Performance":
+        st.subheader("Performance")
+        st.write("*Timings collected by this server process across all sessions*")
 
-    # Filter the original heatmap data to include only the top 5 prefectures
-    heatmap_data = heatmap_data[heatmap_data['Prefecture'].isin(top_5_prefectures)]
-    heatmap_data = heatmap_data.sort_values(by=['station_count'], ascending=False)
-    heatmap_data = heatmap_data.rename(columns={"station_count":"# of Stations"})
+        st.dataframe(timing_report(), hide_index=True, use_container_width=True)
+        col1, col2 = st.columns(2)
+        col1.download_button("Export timings (JSON lines)", export_timings(), file_name="timings.jsonl", mime="application/jsonl")
+        if col2.button("Reset timings"):
+            reset_timings()
+            st.rerun()
 
-    col3.subheader('*Top Prefectures*')
-    col3.dataframe(heatmap_data, hide_index=True, use_container_width=True)
+        st.subheader("Lazy Imports")
+        st.dataframe(import_report(), hide_index=True, use_container_width=True)
 
-    col3.subheader("*Stations Per Year*")
-    stations_per_year = df.groupby('Year').size()
-    stations_per_year.index = stations_per_year.index.astype(str)
-    col3.line_chart(stations_per_year, x_label="Year Opened", y_label="Number of Stations", color="#6298c0")
+        st.subheader("Dataset Snapshot")
+        st.json(get_refresher().status())
+        st.write(f"Query backend: **{get_backend(DATA_PATH, snapshot['version']).name}**")
+
+    else:
+        st.header("**Shinkansen in Japan 🚅**")
+        st.markdown("---")
+
+        col1, col2, col3 = st.columns([1.5, 4.5, 2], gap='medium')
+
+        # The map goes above the static image in the middle column
+        map_slot = col2.container()
+        year_panels(snapshot, col1, map_slot, col3)
 
-    col2.image('train2.png', use_column_width=True)
+        with timed('dashboard.image'):
+            col2.image(image_variant('train2.png', width=1200), use_container_width=True)
@@ -0,0 +1,132 @@
+import os
+
+import streamlit as st
+from streamlit.logger import get_logger
+
+from data import DATA_PATH, FRAME_VERSIONS, dataset_version, fresh_sidecar, load_dataset
+from lazy_imports import lazy_import
+
+logger = get_logger(__name__)
+
+# "pandas" (default), "duckdb" or "polars"; the engines are optional and read the Parquet sidecar.
+# Backends answer the unfiltered rollups only. With an engine the snapshot frame is loaded lazily,
+# so pages that only chart rollups skip it, but the row-level pages still use the pandas frame.
+QUERY_BACKEND_ENV = "DATAVIZ_QUERY_BACKEND"
+
+# Columns counted by the per-category rollups, and the aggregate keys they fill
+COUNT_COLUMNS = {'per_prefecture': 'Prefecture', 'per_company': 'Company', 'per_line': 'Shinkansen_Line'}
+
+DISTANCE = 'Distance from Tokyo Station'
+
+def _counts(frame, column):
+    # Engine result (column, count) as a value_counts-shaped Series, largest first
+    counts = frame.set_index(column)['count'].astype('int64')
+    return counts.sort_values(ascending=False, kind='stable')
+
+class PandasBackend:
+    # The in-memory typed frame; what every query ran on before backends existed
+
+    name = 'pandas'
+
+    def __init__(self, df):
+        self.df = df
+
+    def count_by(self, column):
+        return self.df[column].value_counts()
+
+    def aggregates(self):
+        return {
+            'per_year': self.df.groupby('Year').size(),
+            **{key: self.count_by(column) for key, column in COUNT_COLUMNS.items()},
+            'mean_distance_per_year': self.df.groupby('Year')[DISTANCE].mean(),
+        }
+
+class DuckDBBackend:
+    # SQL over the Parquet sidecar, reading only the columns each rollup needs
+
+    name = 'duckdb'
+
+    def __init__(self, sidecar):
+        duckdb = lazy_import('duckdb')
+        self._connection = duckdb.connect()
+        self._source = "read_parquet('{}')".format(sidecar.replace("'", "''"))
+
+    def _query(self, sql, params=None):
+        # A cursor per query, since sessions call in from different threads
+        return self._connection.cursor().execute(sql, params or []).df()
+
+    def count_by(self, column):
+        frame = self._query(f'SELECT "{column}", count(*) AS count FROM {self._source} GROUP BY 1')
+        return _counts(frame, column)
+
+    def aggregates(self):
+        per_year = self._query(
+            f'SELECT "Year", count(*) AS count, avg("{DISTANCE}") AS "{DISTANCE}" '
+            f'FROM {self._source} GROUP BY 1 ORDER BY 1'
+        ).set_index('Year')
+        return {
+            'per_year': per_year['count'].astype('int64').rename(None),
+            **{key: self.count_by(column) for key, column in COUNT_COLUMNS.items()},
+            'mean_distance_per_year': per_year[DISTANCE],
+        }
+
+class PolarsBackend:
+    # Lazy Polars scans of the Parquet sidecar, reading only the columns each rollup needs
+
+    name = 'polars'
+
+    def __init__(self, sidecar):
+        self._pl = lazy_import('polars')
+        self._sidecar = sidecar
+
+    def _scan(self):
+        return self._pl.scan_parquet(self._sidecar)
+
+    def count_by(self, column):
+        frame = self._scan().group_by(column).agg(self._pl.len().alias('count')).collect().to_pandas()
+        return _counts(frame, column)
+
+    def aggregates(self):
+        pl = self._pl
+        per_year = (
+            self._scan()
+            .group_by('Year')
+            .agg(pl.len().alias('count'), pl.col(DISTANCE).mean())
+            .sort('Year')
+            .collect()
+            .to_pandas()
+            .set_index('Year')
+        )
+        return {
+            'per_year': per_year['count'].astype('int64').rename(None),
+            **{key: self.count_by(column) for key, column in COUNT_COLUMNS.items()},
+            'mean_distance_per_year': per_year[DISTANCE],
+        }
+
+ENGINE_BACKENDS = {'duckdb': DuckDBBackend, 'polars': PolarsBackend}
+
+def configured_backend():
+    # Backend name asked for through QUERY_BACKEND_ENV
+    return (os.environ.get(QUERY_BACKEND_ENV) or 'pandas').lower()
+
+def create_backend(path=DATA_PATH, version=None, name=None):
+    # The configured backend, falling back to pandas when its engine isn't installed or has no sidecar
+    name = (name or configured_backend()).lower()
+    version = version or dataset_version(path)
+    if name in ENGINE_BACKENDS:
+        sidecar = fresh_sidecar(path)
+        if sidecar is None:
+            logger.warning("No Parquet sidecar for %s, using the pandas backend", path)
+        else:
+            try:
+                return ENGINE_BACKENDS[name](sidecar)
+            except ImportError:
+                logger.warning("%s is not installed, using the pandas backend", name)
+    elif name != 'pandas':
+        logger.warning("Unknown query backend %r, using pandas", name)
+    return PandasBackend(load_dataset(path, version))
+
+@st.cache_resource(show_spinner=False, max_entries=FRAME_VERSIONS)
+def get_backend(path=DATA_PATH, version=None):
+    # One backend per dataset version, shared by every session
+    return create_backend(path, version)
@@ -0,0 +1,268 @@
+import argparse
+import importlib.metadata
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from aggregates import build_year_index, compute_aggregates, year_range_summary, year_slice
+from backends import ENGINE_BACKENDS
+from charts import (
+    avg_distance_data, build_company_bar_chart, build_prefecture_bar_figure, build_scatter_density,
+    build_station_scatter, figure_to_png, station_column_layer
+)
+from data import DATA_PATH, attach_shared, build_sidecar, coerce_types, publish_shared, sidecar_path
+from downsample import downsample_frame, downsample_series
+from lazy_imports import lazy_import
+from server_transforms import chart_json
+
+# Headless benchmarks for the load, aggregate and chart paths on synthetic data with the
+# shinkansen.xlsx schema. Run `python benchmark.py --help`; results are written as JSON.
+
+DEFAULT_ROWS = [100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+
+# Writing and reading large workbooks takes minutes, and a sheet stops at 1,048,576 rows anyway
+DEFAULT_MAX_EXCEL_ROWS = 100_000
+
+LOAD_FORMATS = ['xlsx', 'xlsx_sidecar_build', 'csv', 'parquet', 'arrow_mmap']
+
+# Libraries on the timed paths; their versions are recorded with every run
+BENCHMARKED_LIBRARIES = [
+    'numpy', 'pandas', 'pyarrow', 'openpyxl', 'streamlit', 'altair', 'plotly', 'matplotlib', 'pydeck', 'duckdb', 'polars'
+]
+
+# Year ranges the dashboard slider can produce, narrow to full
+YEAR_RANGES = [(1964, 2022), (1980, 2010), (2000, 2010)]
+
+def synthetic_dataset(rows, seed=0, source=DATA_PATH):
+    # Resample the real stations with jittered positions, distances and opening years
+    rng = np.random.default_rng(seed)
+    base = pd.read_excel(source)
+    picks = rng.integers(0, len(base), rows)
+    df = base.iloc[picks].reset_index(drop=True)
+    df['Station Name'] = df['Station Name'] + ' ' + pd.Series(np.arange(rows)).astype(str)
+    df['Year'] = rng.integers(base['Year'].min(), base['Year'].max() + 1, rows)
+    df['Longitude'] = (df['Longitude'] + rng.normal(0, 0.05, rows)).round(4)
+    df['Latitude'] = (df['Latitude'] + rng.normal(0, 0.05, rows)).round(4)
+    df['Distance from Tokyo Station'] = (df['Distance from Tokyo Station'] + rng.uniform(0, 5, rows)).round(1)
+    return df
+
+def measure(func, repeat):
+    # Seconds for each of `repeat` calls
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return {'min': min(samples), 'median': statistics.median(samples), 'samples': samples}
+
+def arrow_bytes(frame):
+    # What Streamlit ships to the browser for native charts and st.vega_lite_chart data
+    if isinstance(frame, pd.Series):
+        frame = frame.to_frame()
+    table = pa.Table.from_pandas(frame)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def deck_json(df):
+    # Layer plus view state serialized the way pydeck_fig hands them to st.pydeck_chart
+    pdk = lazy_import('pydeck')
+    view_state = pdk.ViewState(latitude=df['Latitude'].mean(), longitude=df['Longitude'].mean(), zoom=5, pitch=50)
+    layer, tooltip = station_column_layer(df, zoom=view_state.zoom)
+    return pdk.Deck(layers=[layer], initial_view_state=view_state, tooltip=tooltip).to_json()
+
+def chart_builders(df, aggregates):
+    # The work each page function does before handing its chart to Streamlit
+    return {
+        'area_chart': lambda: arrow_bytes(downsample_series(aggregates['per_year'])[0]),
+        'bar_chart': lambda: arrow_bytes(aggregates['per_prefecture']),
+        'scatter_plot': lambda: arrow_bytes(downsample_frame(
+            df[['Station Name', 'Distance from Tokyo Station', 'Company']], 'Station Name', 'Distance from Tokyo Station'
+        )[0]),
+        'scatter_plot_raster': lambda: figure_to_png(
+            build_scatter_density(df, 'Station Name', 'Distance from Tokyo Station'), dpi=150
+        ),
+        'matplotlib_fig': lambda: figure_to_png(build_station_scatter(df)),
+        'altair_fig': lambda: build_company_bar_chart(aggregates['per_company']).to_dict(),
+        'altair_raw_rows': lambda: chart_json(
+            lazy_import('altair').Chart(df).mark_bar().encode(x='Company:N', y='count()')
+        ),
+        'vega_fig': lambda: arrow_bytes(avg_distance_data(aggregates)),
+        'plotly_fig': lambda: build_prefecture_bar_figure(aggregates['per_prefecture']).to_json(),
+        'pydeck_fig': lambda: deck_json(df),
+    }
+
+def mask_filter(df, start, end):
+    # The dashboard's original boolean-mask year filter, kept as a baseline
+    years = df['Year'].dt.year
+    return df[(years >= start) & (years <= end)]
+
+def write_sources(raw, workdir, formats, max_excel_rows):
+    # Source files for each load format; None marks a format skipped at this size
+    paths = {}
+    if {'xlsx', 'xlsx_sidecar_build'} & set(formats):
+        paths['xlsx'] = None
+        if len(raw) <= max_excel_rows:
+            paths['xlsx'] = os.path.join(workdir, "stations.xlsx")
+            raw.to_excel(paths['xlsx'], index=False)
+    if 'csv' in formats:
+        paths['csv'] = os.path.join(workdir, "stations.csv")
+        raw.to_csv(paths['csv'], index=False)
+    if 'parquet' in formats:
+        paths['parquet'] = os.path.join(workdir, "stations-typed.parquet")
+        coerce_types(raw.copy()).to_parquet(paths['parquet'], index=False)
+    return paths
+
+def bench_loads(raw, df, workdir, formats, max_excel_rows, repeat):
+    paths = write_sources(raw, workdir, formats, max_excel_rows)
+    loaders = {
+        'xlsx': lambda: coerce_types(pd.read_excel(paths['xlsx'])),
+        'xlsx_sidecar_build': lambda: build_sidecar(paths['xlsx']),
+        'csv': lambda: coerce_types(pd.read_csv(paths['csv'])),
+        'parquet': lambda: coerce_types(pd.read_parquet(paths['parquet'])),
+    }
+    results = {}
+    for fmt in formats:
+        if fmt == 'arrow_mmap':
+            shared_file = publish_shared(df, os.path.join(workdir, "stations.xlsx"), "bench", workdir)
+            results[fmt] = measure(lambda: attach_shared(shared_file), repeat)
+        elif paths.get(fmt.split('_')[0]) is None:
+            results[fmt] = None
+        else:
+            results[fmt] = measure(loaders[fmt], repeat)
+    if paths.get('xlsx') and os.path.exists(sidecar_path(paths['xlsx'])):
+        os.remove(sidecar_path(paths['xlsx']))
+    return results
+
+def bench_size(rows, args, workdir):
+    log(f"{rows:,} rows: generating")
+    raw = synthetic_dataset(rows, seed=args.seed)
+    df = coerce_types(raw.copy())
+    result = {'rows': rows}
+
+    log(f"{rows:,} rows: load")
+    result['load'] = bench_loads(raw, df, workdir, args.formats, args.max_excel_rows, args.repeat)
+
+    log(f"{rows:,} rows: aggregates")
+    result['aggregates'] = {
+        'compute_aggregates': measure(lambda: compute_aggregates(df), args.repeat),
+        'build_year_index': measure(lambda: build_year_index(df), args.repeat),
+    }
+    typed_parquet = os.path.join(workdir, "stations-typed.parquet")
+    for name, backend_class in ENGINE_BACKENDS.items():
+        if not os.path.exists(typed_parquet):
+            break
+        try:
+            backend = backend_class(typed_parquet)
+        except ImportError:
+            result['aggregates'][f"{name}_backend"] = None
+            continue
+        result['aggregates'][f"{name}_backend"] = measure(backend.aggregates, args.repeat)
+
+    log(f"{rows:,} rows: year filter")
+    year_index = build_year_index(df)
+    result['year_filter'] = {
+        f"{start}-{end}": {
+            'mask': measure(lambda: mask_filter(df, start, end), args.repeat),
+            'year_index': measure(
+                lambda: (year_slice(year_index, start, end), year_range_summary(year_index, start, end)),
+                args.repeat
+            ),
+        }
+        for start, end in YEAR_RANGES
+    }
+
+    aggregates = compute_aggregates(df)
+    result['charts'] = {}
+    for name, build in chart_builders(df, aggregates).items():
+        if name not in args.charts:
+            continue
+        log(f"{rows:,} rows: {name}")
+        # Untimed first call, so lazy imports aren't billed to the smallest size
+        build()
+        result['charts'][name] = measure(build, args.repeat)
+    return result
+
+def library_version(name):
+    # Installed version, or None for optional engines that aren't installed
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'libraries': {name: library_version(name) for name in BENCHMARKED_LIBRARIES},
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+    }
+
+def compare(old_path, new_path):
+    # Median ratios new/old for every measurement both runs share; below 1 is faster
+    with open(old_path) as f:
+        old = {r['rows']: r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = {r['rows']: r for r in json.load(f)['results']}
+
+    def walk(prefix, a, b):
+        if isinstance(a, dict) and 'median' in a:
+            if isinstance(b, dict) and 'median' in b:
+                print(f"{prefix:<60} {a['median'] * 1000:>10.2f} ms {b['median'] * 1000:>10.2f} ms {b['median'] / a['median']:>7.2f}x")
+        elif isinstance(a, dict) and isinstance(b, dict):
+            for key in a:
+                if key in b:
+                    walk(f"{prefix}/{key}", a[key], b[key])
+
+    for rows in sorted(old.keys() & new.keys()):
+        walk(f"{rows}", old[rows], new[rows])
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the data and chart paths on synthetic data.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--formats', nargs='+', choices=LOAD_FORMATS, default=LOAD_FORMATS)
+    parser.add_argument('--charts', nargs='+', default=list(chart_builders(None, None)))
+    parser.add_argument('--max-excel-rows', type=int, default=DEFAULT_MAX_EXCEL_ROWS)
+    parser.add_argument('--output', default="benchmark.json")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="print median ratios of two result files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="dataviz-bench-")
+    try:
+        results = [bench_size(rows, args, workdir) for rows in args.rows]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+    log(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
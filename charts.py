@@ -0,0 +1,371 @@
+import io
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from aggregates import load_aggregates, load_year_index, year_range_summary
+from data import load_dataset
+from downsample import downsample_frame, finite_positions
+from lazy_imports import lazy_import
+from perf import timed_function
+from server_transforms import evaluate_transforms
+
+CUSTOM_COLORS = ['#c18489', '#e3a8b3', '#87bbe2', '#c7daed', '#6298c0']
+
+# Columns the pydeck ColumnLayer and its tooltip actually reference
+DECK_COLUMNS = ['Longitude', 'Latitude', 'Station Name', 'Prefecture', 'Shinkansen_Line']
+
+STATION_TOOLTIP = {"text": "Station: {Station Name}\nPrefecture: {Prefecture}\nLine: {Shinkansen_Line}"}
+CELL_TOOLTIP = {"text": "Stations: {count}"}
+
+# Past this many rows the maps draw server-side grid cells instead of one element per station
+MAP_POINT_LIMIT = 5000
+
+# Finished Altair/Plotly chart objects kept per process; least recently used are evicted first
+CHART_CACHE_SIZE = 32
+
+# Plotly scatter traces past this many points in total are drawn with WebGL (scattergl)
+WEBGL_POINT_LIMIT = 5000
+
+# Fixed company colors for the dashboard pie chart
+COMPANY_COLORS = {
+    'JR Central': '#c18489',
+    'JR East': '#e3a8b3',
+    'JR West': '#87bbe2',
+    'JR Kyushu': '#c7daed',
+    'JR Hokkaido': '#6298c0',
+}
+
+# Network diagram shown by graphviz_fig
+SHINKANSEN_GRAPH = '''
+    digraph G {
+        rankdir=LR;
+        
+        Tokaido_Shinkansen [label="Tokaido Shinkansen", shape=box, style=filled, color="#c18489"];
+        Sanyo_Shinkansen [label="Sanyo Shinkansen", shape=box, style=filled, color="#87bbe2"];
+        Tohoku_Shinkansen [label="Tohoku Shinkansen", shape=box, style=filled, color="#6298c0"];
+        
+        Tokyo [label="Tokyo Station", shape=ellipse];
+        Shin_Yokohama [label="Shin-Yokohama Station", shape=ellipse];
+        Kyoto [label="Kyoto Station", shape=ellipse];
+        Osaka [label="Osaka Station", shape=ellipse];
+        Sendai [label="Sendai Station", shape=ellipse];
+        
+        Tokaido_Shinkansen -> Tokyo;
+        Tokaido_Shinkansen -> Shin_Yokohama;
+        Tokaido_Shinkansen -> Kyoto;
+        Sanyo_Shinkansen -> Kyoto;
+        Sanyo_Shinkansen -> Osaka;
+        Tohoku_Shinkansen -> Tokyo;
+        Tohoku_Shinkansen -> Sendai;
+    }
+    '''
+
+# Roughly how many metres one degree of latitude covers
+METRES_PER_DEGREE = 111_320
+
+# Vega-Lite spec for vega_fig, built once; the data is passed separately so it goes over Arrow
+AVG_DISTANCE_SPEC = {
+    "mark": {
+        "type": "line",
+        "color": "#c18489"
+    },
+    "encoding": {
+        "x": {"field": "Year", "type": "temporal", "title": "Year"},
+        "y": {"field": "Average Distance", "type": "quantitative", "title": "Average Distance (km)"},
+        "tooltip": [{"field": "Year", "type": "temporal"}, {"field": "Average Distance", "type": "quantitative"}]
+    },
+    "title": "Average Distance from Tokyo Station by Year"
+}
+
+@timed_function()
+def build_station_scatter(df, figsize=(6, 4), vectorized=True, legend=False):
+    # Object-oriented Figure that is never registered with pyplot's global state
+    Figure = lazy_import('matplotlib.figure').Figure
+
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    if vectorized:
+        # One scatter call, colored through the line's categorical code
+        codes, shinkansen_lines = pd.factorize(df['Shinkansen_Line'])
+        palette = np.array(CUSTOM_COLORS)
+        ax.scatter(
+            df['Longitude'], df['Latitude'],
+            alpha=0.7, edgecolors='w', s=30,
+            c=palette[codes % len(palette)]
+        )
+        if legend:
+            Line2D = lazy_import('matplotlib.lines').Line2D
+            handles = [
+                Line2D([], [], linestyle='', marker='o', markersize=6, alpha=0.7,
+                       markerfacecolor=palette[i % len(palette)], markeredgecolor='w', label=line)
+                for i, line in enumerate(shinkansen_lines)
+            ]
+            ax.legend(handles=handles, fontsize='small')
+    else:
+        shinkansen_lines = df['Shinkansen_Line'].unique()
+        color_map = {line: CUSTOM_COLORS[i % len(CUSTOM_COLORS)] for i, line in enumerate(shinkansen_lines)}
+        for line in shinkansen_lines:
+            subset = df[df['Shinkansen_Line'] == line]
+            ax.scatter(
+                subset['Longitude'], subset['Latitude'],
+                alpha=0.7, label=line,
+                edgecolors='w', s=30,
+                c=color_map[line]
+            )
+        if legend:
+            ax.legend(fontsize='small')
+
+    ax.set_title('Shinkansen Stations in Japan')
+    ax.set_xlabel('Longitude')
+    ax.set_ylabel('Latitude')
+    ax.grid(True)
+    return fig
+
+@timed_function()
+def figure_to_png(fig, dpi=200):
+    # Rasterize with the same defaults as st.pyplot, then drop the figure's artists
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format='png', bbox_inches='tight', dpi=dpi)
+    finally:
+        fig.clear()
+    return buffer.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def station_scatter_png(path, version, figsize=(6, 4), dpi=200, vectorized=True, legend=False):
+    # PNG bytes keyed by dataset version and plot parameters
+    fig = build_station_scatter(load_dataset(path, version), figsize=figsize, vectorized=vectorized, legend=legend)
+    return figure_to_png(fig, dpi=dpi)
+
+# Grid of the server-side scatter density image, x by y
+DENSITY_BINS = (300, 150)
+
+@timed_function()
+def build_scatter_density(df, x, y, figsize=(8, 4), bins=DENSITY_BINS, x_label=None, y_label=None):
+    # Point counts on a fixed grid drawn as one image, so the cost doesn't grow with the rows sent
+    Figure = lazy_import('matplotlib.figure').Figure
+    LogNorm = lazy_import('matplotlib.colors').LogNorm
+    LinearSegmentedColormap = lazy_import('matplotlib.colors').LinearSegmentedColormap
+
+    # Rows with a missing x or y have no cell
+    x_positions, y_positions, _ = finite_positions(df, x, y)
+    counts, x_edges, y_edges = np.histogram2d(x_positions, y_positions, bins=bins)
+    cmap = LinearSegmentedColormap.from_list('stations', ['#c7daed', '#6298c0', '#c18489'])
+    cmap.set_bad('white')
+
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    image = ax.imshow(
+        np.ma.masked_equal(counts.T, 0), origin='lower', aspect='auto', cmap=cmap,
+        norm=LogNorm(vmin=1), interpolation='nearest',
+        extent=(x_edges[0], x_edges[-1], y_edges[0], y_edges[-1])
+    )
+    fig.colorbar(image, ax=ax, label='Points per cell')
+    if not pd.api.types.is_numeric_dtype(df[x]):
+        # One tick per category is unreadable at this scale
+        ax.set_xticks([])
+    ax.set_xlabel(x_label or x)
+    ax.set_ylabel(y_label or y)
+    return fig
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def scatter_density_png(path, version, x, y, x_label=None, y_label=None, dpi=150):
+    # PNG bytes of build_scatter_density for one dataset version, and how many points it counts
+    df = load_dataset(path, version)
+    fig = build_scatter_density(df, x, y, x_label=x_label, y_label=y_label)
+    return figure_to_png(fig, dpi=dpi), int(finite_positions(df, x, y)[2].sum())
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def scatter_sample(path, version, x, y, columns, max_points):
+    # Plotted columns reduced by downsample_frame, with the dict describing the reduction
+    return downsample_frame(load_dataset(path, version)[list(columns)], x, y, max_points=max_points)
+
+def deck_layer_data(df, precision=5):
+    # Only the columns the layer reads get serialized; 5 decimals is about a metre
+    return df[DECK_COLUMNS].round({'Longitude': precision, 'Latitude': precision})
+
+def grid_cell_degrees(zoom, cell_pixels=8):
+    # Width in degrees of a cell that spans `cell_pixels` screen pixels at a web-mercator zoom level
+    return cell_pixels * 360 / (256 * 2 ** zoom)
+
+@timed_function()
+def grid_bin_points(df, zoom, cell_pixels=8):
+    # Count stations per square grid cell; one row per non-empty cell, placed at its center
+    size = grid_cell_degrees(zoom, cell_pixels)
+    longitude = df['Longitude'].to_numpy(dtype='float64', na_value=np.nan)
+    latitude = df['Latitude'].to_numpy(dtype='float64', na_value=np.nan)
+    # Stations without a position belong to no cell
+    placed = np.isfinite(longitude) & np.isfinite(latitude)
+    cells = pd.DataFrame({
+        'x': np.floor(longitude[placed] / size).astype('int64'),
+        'y': np.floor(latitude[placed] / size).astype('int64'),
+    })
+    binned = cells.groupby(['x', 'y']).size().reset_index(name='count')
+    binned['Longitude'] = (binned['x'] + 0.5) * size
+    binned['Latitude'] = (binned['y'] + 0.5) * size
+    # Cells are drawn from 1x up to 5x the height of a single station column
+    binned['elevation'] = 1000 + 4000 * binned['count'] / binned['count'].max()
+    binned['radius'] = size * METRES_PER_DEGREE / 2
+    return binned[['Longitude', 'Latitude', 'count', 'elevation', 'radius']]
+
+def map_points(df, zoom=5, max_points=MAP_POINT_LIMIT):
+    # Station rows for st.map, or grid cells once there are too many to draw individually.
+    # A cell's circle area grows with its station count, the busiest filling the cell.
+    if len(df) <= max_points:
+        return df
+    cells = grid_bin_points(df, zoom)
+    cells['size'] = cells['radius'] * np.sqrt(cells['count'] / cells['count'].max())
+    return cells
+
+def station_column_layer(df, zoom=5, max_points=MAP_POINT_LIMIT):
+    # ColumnLayer and tooltip for the station maps, binned server-side past max_points
+    pdk = lazy_import('pydeck')
+    if len(df) <= max_points:
+        layer = pdk.Layer(
+            'ColumnLayer',
+            data=deck_layer_data(df),  # Only the columns the layer and tooltip use
+            get_position='[Longitude, Latitude]',
+            get_elevation=1000,  # Fixed elevation for all stations
+            elevation_scale=50,
+            radius=10000,  # Adjust the radius of the columns
+            get_fill_color='[98, 152, 192, 255]',  # RGBA color format
+            pickable=True,  # Enable picking for interactivity
+            auto_highlight=True
+        )
+        return layer, STATION_TOOLTIP
+
+    cells = grid_bin_points(df, zoom)
+    layer = pdk.Layer(
+        'ColumnLayer',
+        data=cells[['Longitude', 'Latitude', 'count', 'elevation']],
+        get_position='[Longitude, Latitude]',
+        get_elevation='elevation',  # Taller columns for busier cells
+        elevation_scale=50,
+        radius=grid_cell_degrees(zoom) * METRES_PER_DEGREE / 2,  # Columns fill their grid cell
+        get_fill_color='[98, 152, 192, 255]',
+        pickable=True,
+        auto_highlight=True
+    )
+    return layer, CELL_TOOLTIP
+
+def avg_distance_data(aggregates):
+    # Two-column frame for AVG_DISTANCE_SPEC, straight from the aggregate store
+    return aggregates['mean_distance_per_year'].rename('Average Distance').reset_index()
+
+def _color_map(values):
+    # Cycle CUSTOM_COLORS over values in order
+    return {value: CUSTOM_COLORS[i % len(CUSTOM_COLORS)] for i, value in enumerate(values)}
+
+@timed_function()
+def build_company_bar_chart(per_company):
+    # Altair bar chart of stations per company for altair_fig
+    alt = lazy_import('altair')
+
+    company_counts = per_company.reset_index()
+    company_counts.columns = ['Company', 'Number of Stations']
+
+    color_map = _color_map(company_counts['Company'].unique())
+    color_scale = alt.Scale(domain=list(color_map.keys()), range=list(color_map.values()))
+
+    return alt.Chart(company_counts).mark_bar().encode(
+        x=alt.X('Company:N', sort='-y', title='Company'),
+        y=alt.Y('Number of Stations:Q', title='Number of Stations'),
+        color=alt.Color('Company:N', scale=color_scale),
+        tooltip=['Company:N', 'Number of Stations:Q']
+    ).properties(
+        title='Number of Shinkansen Stations by Company',
+        width=600,
+        height=400
+    )
+
+def webgl_traces(fig, max_points=WEBGL_POINT_LIMIT):
+    # Swap SVG scatter traces for scattergl once the figure has more than max_points markers
+    scatters = [trace for trace in fig.data if trace.type == 'scatter']
+    if sum(len(trace.x if trace.x is not None else trace.y) for trace in scatters) <= max_points:
+        return fig
+    go = lazy_import('plotly.graph_objects')
+    traces = [
+        go.Scattergl({key: value for key, value in trace.to_plotly_json().items() if key != 'type'})
+        if trace.type == 'scatter' else trace
+        for trace in fig.data
+    ]
+    return go.Figure(data=traces, layout=fig.layout)
+
+@timed_function()
+def build_prefecture_bar_figure(per_prefecture, single_trace=True):
+    # Plotly bar chart of stations per prefecture for plotly_fig.
+    # single_trace draws every bar in one trace with a color per bar instead of one trace per prefecture.
+    prefecture_counts = per_prefecture.reset_index()
+    prefecture_counts.columns = ['Prefecture', 'Number of Stations']
+    color_map = _color_map(prefecture_counts['Prefecture'].unique())
+
+    if single_trace:
+        go = lazy_import('plotly.graph_objects')
+        fig = go.Figure(go.Bar(
+            x=prefecture_counts['Prefecture'],
+            y=prefecture_counts['Number of Stations'],
+            marker_color=prefecture_counts['Prefecture'].map(color_map).tolist(),
+            hovertemplate='Prefecture=%{x}<br>Number of Stations=%{y}<extra></extra>'
+        ))
+        fig.update_layout(title='Number of Shinkansen Stations by Prefecture', height=600)
+    else:
+        px = lazy_import('plotly.express')
+        fig = px.bar(
+            prefecture_counts,
+            x='Prefecture',
+            y='Number of Stations',
+            color='Prefecture',
+            title='Number of Shinkansen Stations by Prefecture',
+            labels={'Prefecture': 'Prefecture', 'Number of Stations': 'Number of Stations'},
+            height=600,
+            color_discrete_map=color_map
+        )
+    fig.update_layout(
+        xaxis_title='Prefecture',
+        yaxis_title='Number of Stations',
+        xaxis={'categoryorder':'total descending'}
+    )
+    return webgl_traces(fig)
+
+# The cached builders below are keyed by dataset version and filter state; Streamlit applies
+# its theme when the chart is displayed, so the cached objects don't depend on it.
+# The objects are shared between sessions, so callers only display them.
+# Altair charts go through evaluate_transforms, so only rows their spec actually draws are embedded.
+
+@st.cache_resource(show_spinner=False, max_entries=CHART_CACHE_SIZE)
+def company_bar_chart(path, version):
+    return evaluate_transforms(build_company_bar_chart(load_aggregates(path, version)['per_company']))
+
+@st.cache_resource(show_spinner=False, max_entries=CHART_CACHE_SIZE)
+@timed_function()
+def company_pie_chart(path, version, year_range):
+    # Altair pie chart of stations per company for the dashboard's selected year range
+    alt = lazy_import('altair')
+
+    company_counts = year_range_summary(load_year_index(path, version), *year_range)['per_company']
+    pie_data = company_counts[company_counts > 0].rename_axis('Company').reset_index(name='# of Stations')
+    color_scale = alt.Scale(domain=list(COMPANY_COLORS.keys()), range=list(COMPANY_COLORS.values()))
+
+    return evaluate_transforms(alt.Chart(pie_data).mark_arc().encode(
+        theta=alt.Theta('# of Stations:Q', stack=True),
+        color=alt.Color('Company:N', scale=color_scale, legend=None),
+        tooltip=['Company:N', '# of Stations:Q']
+    ).properties(
+        width=150,
+        height=150
+    ))
+
+@st.cache_data(show_spinner=False, max_entries=CHART_CACHE_SIZE)
+def prefecture_bar_json(path, version):
+    # Serialized once per dataset version
+    return build_prefecture_bar_figure(load_aggregates(path, version)['per_prefecture']).to_json()
+
+@st.cache_resource(show_spinner=False, max_entries=CHART_CACHE_SIZE)
+def plotly_figure_from_json(text):
+    # st.plotly_chart re-validates plain dicts by rebuilding a Figure on every call, so rebuild it once here
+    return lazy_import('plotly.io').from_json(text)
+
+def prefecture_bar_figure(path, version):
+    return plotly_figure_from_json(prefecture_bar_json(path, version))
@@ -0,0 +1,235 @@
+import hashlib
+import os
+
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+import streamlit as st
+from streamlit.logger import get_logger
+
+from perf import timed_function
+
+logger = get_logger(__name__)
+
+DATA_PATH = "shinkansen.xlsx"
+
+# Low-cardinality text columns, stored dictionary-encoded
+CATEGORICAL_COLUMNS = ['Company', 'Prefecture', 'Shinkansen_Line']
+
+NUMERIC_COLUMNS = ['Distance from Tokyo Station', 'Longitude', 'Latitude']
+
+# Rows per chunk when streaming a large source
+CHUNK_ROWS = 50_000
+
+# Versions of the full frame (and what holds it) kept per process: the current snapshot plus
+# one the refresher is building, so swapped-out frames are released
+FRAME_VERSIONS = 2
+
+# Set to a directory shared by every server process (e.g. /dev/shm) to map one copy of the data
+SHARED_DIR_ENV = "DATAVIZ_SHARED_DIR"
+
+# (path, mtime, size) -> content hash, so the file is only re-hashed when it changes on disk
+_hash_memo = {}
+
+def dataset_version(path=DATA_PATH):
+    # Version string made of the file's mtime and content hash
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    digest = _hash_memo.get(memo_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        digest = sha.hexdigest()[:16]
+        _hash_memo.clear()
+        _hash_memo[memo_key] = digest
+    return f"{stat.st_mtime_ns}-{digest}"
+
+def coerce_types(df, categorical=True):
+    # Apply the column types the charts expect to whichever of those columns are present
+    if 'Year' in df and not pd.api.types.is_datetime64_any_dtype(df['Year']):
+        df['Year'] = pd.to_datetime(df['Year'], format='%Y')
+    for column in NUMERIC_COLUMNS:
+        if column in df:
+            df[column] = pd.to_numeric(df[column]).astype('float64')
+    if categorical:
+        for column in CATEGORICAL_COLUMNS:
+            if column in df:
+                df[column] = df[column].astype('category')
+    return df
+
+def _iter_excel_chunks(path, chunk_rows, columns):
+    # openpyxl's read-only mode streams rows instead of loading the whole sheet
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = list(next(rows, ()))
+        keep = [header.index(column) for column in columns] if columns else list(range(len(header)))
+        names = [header[i] for i in keep]
+        batch = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            batch.append([row[i] for i in keep])
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame(batch, columns=names)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=names)
+    finally:
+        workbook.close()
+
+def iter_chunks(path=DATA_PATH, chunk_rows=CHUNK_ROWS, columns=None):
+    # Typed DataFrame chunks from an .xlsx, .csv or .parquet source, keeping only `columns`.
+    # Text columns stay plain strings so every chunk shares one schema.
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        chunks = pd.read_csv(path, usecols=columns, chunksize=chunk_rows)
+    elif extension == '.parquet':
+        batches = pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns)
+        chunks = (batch.to_pandas() for batch in batches)
+    else:
+        chunks = _iter_excel_chunks(path, chunk_rows, columns)
+    for chunk in chunks:
+        yield coerce_types(chunk, categorical=False)
+
+def sidecar_path(path=DATA_PATH):
+    # Typed Parquet copy that lives next to the workbook
+    return os.path.splitext(path)[0] + ".parquet"
+
+def _sidecar_field(field):
+    # CATEGORICAL_COLUMNS dictionary-encoded, and columns the first chunk had no values for stored
+    # as text so later chunks fit. The other typed columns already have fixed types from coerce_types.
+    if field.name in CATEGORICAL_COLUMNS:
+        return field.with_type(pa.dictionary(pa.int32(), pa.large_string()))
+    if pa.types.is_null(field.type):
+        return field.with_type(pa.large_string())
+    return field
+
+def _sidecar_schema(table):
+    return pa.schema([_sidecar_field(field) for field in table.schema])
+
+def build_sidecar(path=DATA_PATH, chunk_rows=CHUNK_ROWS):
+    # Stream the workbook into Parquet one row group per chunk, so memory is bounded by chunk_rows.
+    # Returns False when the sidecar couldn't be written; the caller then reads the workbook itself.
+    sidecar = sidecar_path(path)
+    tmp_path = f"{sidecar}.{os.getpid()}.tmp"
+    writer = None
+    try:
+        for chunk in iter_chunks(path, chunk_rows):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, _sidecar_schema(table))
+            writer.write_table(table.cast(writer.schema))
+        if writer is None:
+            return False
+        writer.close()
+        writer = None
+        os.replace(tmp_path, sidecar)
+        return True
+    except (OSError, ValueError, pa.ArrowException) as e:
+        # Read-only checkout, or chunks whose types don't line up: keep serving from the workbook
+        logger.warning("Could not build the sidecar for %s: %r", path, e)
+        return False
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _read_sidecar(sidecar):
+    return coerce_types(pd.read_parquet(sidecar))
+
+def fresh_sidecar(path=DATA_PATH, rebuild=False):
+    # Path of a sidecar at least as new as the workbook, building it if needed; None if it can't be written
+    sidecar = sidecar_path(path)
+    if not rebuild and os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(path):
+        return sidecar
+    return sidecar if build_sidecar(path) else None
+
+@timed_function()
+def read_source(path=DATA_PATH):
+    # Prefer the sidecar; rebuild it when the workbook is newer or it can't be read
+    sidecar = fresh_sidecar(path)
+    if sidecar is not None:
+        try:
+            return _read_sidecar(sidecar)
+        except (OSError, ValueError):
+            sidecar = fresh_sidecar(path, rebuild=True)
+    if sidecar is not None:
+        return _read_sidecar(sidecar)
+    return coerce_types(pd.read_excel(path))
+
+def shared_path(path, version, shared_dir):
+    # Arrow IPC file holding one dataset version for all processes
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(shared_dir, f"{stem}-{version}.arrow")
+
+def _version_mtime(version):
+    # The mtime part of a dataset_version string, None for anything else
+    try:
+        return int(version.split('-', 1)[0])
+    except ValueError:
+        return None
+
+def publish_shared(df, path, version, shared_dir):
+    # Write the typed frame ordered by Year, uncompressed and as one record batch, so it can be
+    # memory-mapped and the year index can slice it in place; then drop older versions.
+    # Processes that still map an old file keep their mapping after it is unlinked.
+    target = shared_path(path, version, shared_dir)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    os.makedirs(shared_dir, exist_ok=True)
+    if not df['Year'].is_monotonic_increasing:
+        df = df.sort_values('Year', kind='stable', ignore_index=True)
+    feather.write_feather(df, tmp_path, compression='uncompressed', chunksize=max(len(df), 1))
+    os.replace(tmp_path, target)
+
+    # Only versions older than this one: a lagging process must not remove a newer publication
+    current = _version_mtime(version)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for name in os.listdir(shared_dir):
+        if not (name.startswith(f"{stem}-") and name.endswith(".arrow")):
+            continue
+        mtime = _version_mtime(name[len(stem) + 1:-len(".arrow")])
+        if current is not None and mtime is not None and mtime < current:
+            try:
+                os.remove(os.path.join(shared_dir, name))
+            except OSError:
+                pass
+    return target
+
+def attach_shared(shared_file):
+    # Numeric, datetime and string columns point into the mapped file's pages, which the OS shares
+    # between processes; strings only because pandas 3 keeps them Arrow-backed (hence pandas>=3).
+    # Categorical codes are copied into private memory (one byte per row).
+    with pa.memory_map(shared_file) as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(split_blocks=True)
+
+def load_shared(path, version, shared_dir):
+    # Attach to the published copy of this version, publishing it first if no process has yet,
+    # or again if it was removed before we could map it
+    shared_file = shared_path(path, version, shared_dir)
+    if os.path.exists(shared_file):
+        try:
+            return attach_shared(shared_file)
+        except FileNotFoundError:
+            pass
+    publish_shared(read_source(path), path, version, shared_dir)
+    return attach_shared(shared_file)
+
+@st.cache_resource(show_spinner=False, max_entries=FRAME_VERSIONS)
+def _load_dataset(path, version):
+    # `version` is only here to key the cache
+    shared_dir = os.environ.get(SHARED_DIR_ENV)
+    if shared_dir:
+        return load_shared(path, version, shared_dir)
+    return read_source(path)
+
+def load_dataset(path=DATA_PATH, version=None):
+    # Parsed and typed once per dataset version, shared across reruns and sessions.
+    # The same frame is handed to every session, so callers must not modify it.
+    return _load_dataset(path, version or dataset_version(path))
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+# About one point per horizontal pixel of a wide chart
+LINE_CHART_MAX_POINTS = 1500
+
+# Vega-Lite scatter charts stay responsive up to a few thousand marks
+SCATTER_POINT_LIMIT = 5000
+
+METHOD_LABELS = {'lttb': 'LTTB', 'minmax': 'min/max', 'stratified': 'density-preserving'}
+
+def _numeric_x(index):
+    # Positions along the x axis as floats, for datetime or numeric indexes
+    if isinstance(index, pd.DatetimeIndex):
+        return index.asi8.astype('float64')
+    try:
+        return np.asarray(index, dtype='float64')
+    except (TypeError, ValueError):
+        return np.arange(len(index), dtype='float64')
+
+def axis_positions(values):
+    # Numeric positions for a column: numbers as-is, datetimes as ns, categories by first appearance.
+    # Missing numbers and datetimes are NaN.
+    if pd.api.types.is_datetime64_any_dtype(values):
+        positions = values.to_numpy().astype('datetime64[ns]').astype('int64').astype('float64')
+        positions[values.isna().to_numpy()] = np.nan
+        return positions
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype='float64', na_value=np.nan)
+    return pd.factorize(values)[0].astype('float64')
+
+def finite_positions(df, x, y):
+    # Axis positions of the rows a scatter of y against x can place, and the mask selecting them
+    x_positions, y_positions = axis_positions(df[x]), axis_positions(df[y])
+    finite = np.isfinite(x_positions) & np.isfinite(y_positions)
+    return x_positions[finite], y_positions[finite], finite
+
+def lttb_indices(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: keeps the point that forms the biggest triangle per bucket
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype('int64')
+    selected = np.empty(n_out, dtype='int64')
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third triangle corner
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[end:next_end].mean() if next_end > end else x[-1]
+        next_y = y[end:next_end].mean() if next_end > end else y[-1]
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+def minmax_indices(y, n_out):
+    # The minimum and maximum of each bucket, so every peak and trough survives
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    # Two points per bucket plus both endpoints stays within n_out
+    buckets = np.arange(n) * max((n_out - 2) // 2, 1) // n
+    # NaN rows are dropped first, so buckets with no values are skipped rather than breaking idxmin
+    order = pd.DataFrame({'bucket': buckets, 'y': y}).dropna(subset=['y'])
+    grouped = order.groupby('bucket')['y']
+    keep = np.union1d(grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy())
+    return np.union1d(keep, [0, n - 1])
+
+def stratified_indices(x, y, n_out, bins=32, seed=0):
+    # Sample within a bins x bins grid in proportion to each cell's count; x and y must be finite.
+    # Every non-empty cell keeps at least one point, so sparse regions and outliers survive.
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+
+    def cell_of(values):
+        low, high = values.min(), values.max()
+        scale = bins / (high - low) if high > low else 0
+        return np.minimum(((values - low) * scale).astype('int64'), bins - 1)
+
+    cells = cell_of(x) * bins + cell_of(y)
+    counts = np.bincount(cells, minlength=bins * bins)
+    occupied = int((counts > 0).sum())
+    if occupied >= n_out:
+        # More occupied cells than points to keep: plain random sample
+        return np.sort(rng.choice(n, n_out, replace=False))
+    quota = 1 + counts * (n_out - occupied) // n
+
+    # Random order within each cell, then keep each cell's first `quota` rows
+    order = np.lexsort((rng.random(n), cells))
+    sorted_cells = cells[order]
+    rank = np.arange(n) - np.searchsorted(sorted_cells, sorted_cells, side='left')
+    return np.sort(order[rank < quota[sorted_cells]])
+
+def downsample_frame(df, x, y, max_points=SCATTER_POINT_LIMIT, seed=0):
+    # Rows of df reduced for a scatter of y against x; the dict describes what was done
+    info = {'method': None, 'original_points': len(df), 'points': len(df)}
+    if max_points is None or len(df) <= max_points:
+        return df, info
+    # Rows with a missing x or y can't be drawn or binned, so they are dropped and not counted
+    x_positions, y_positions, finite = finite_positions(df, x, y)
+    if not finite.all():
+        df = df[finite]
+        info.update(original_points=len(df), points=len(df))
+        if len(df) <= max_points:
+            return df, info
+    keep = stratified_indices(x_positions, y_positions, max_points, seed=seed)
+    reduced = df.iloc[keep]
+    info.update(method='stratified', points=len(reduced))
+    return reduced, info
+
+def downsample_series(series, max_points=LINE_CHART_MAX_POINTS, method='lttb'):
+    # Reduce a series to at most max_points before charting; the dict describes what was done
+    info = {'method': None, 'original_points': len(series), 'points': len(series)}
+    if max_points is None or len(series) <= max_points:
+        return series, info
+    y = series.to_numpy(dtype='float64')
+    if method == 'lttb':
+        keep = lttb_indices(_numeric_x(series.index), y, max_points)
+    elif method == 'minmax':
+        keep = minmax_indices(y, max_points)
+    else:
+        raise ValueError(f"Unknown downsampling method: {method!r}")
+    reduced = series.iloc[keep]
+    info.update(method=method, points=len(reduced))
+    return reduced, info
+
+def downsample_caption(info):
+    # Chart caption describing the reduction, or None when the series was left alone
+    if info['method'] is None:
+        return None
+    return f"Showing {info['points']:,} of {info['original_points']:,} points ({METHOD_LABELS[info['method']]} downsampling)"
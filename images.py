@@ -0,0 +1,62 @@
+import io
+import os
+
+import streamlit as st
+from PIL import Image, features
+
+from perf import timed_function
+
+# Encoded variants survive restarts here, next to the app
+IMAGE_CACHE_DIR = os.path.join(".cache", "images")
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+def default_format():
+    # WebP keeps transparency and is smaller; fall back to JPEG if Pillow was built without it
+    return 'WEBP' if features.check('webp') else 'JPEG'
+
+@timed_function()
+def encode_image(path, width, fmt, quality=80):
+    # Decode once, downscale to the display width and re-encode
+    with Image.open(path) as image:
+        image.load()
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            image = image.resize((width, height), Image.LANCZOS)
+        if fmt == 'JPEG' and image.mode != 'RGB':
+            # JPEG has no alpha channel, so flatten onto the page background
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt, quality=quality)
+    return buffer.getvalue()
+
+def _write_atomic(cache_path, data):
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # Read-only checkout: the in-memory cache still applies
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _image_variant(path, mtime_ns, width, fmt, quality):
+    # `mtime_ns` is only here to key the cache
+    stem = os.path.splitext(os.path.basename(path))[0]
+    cache_path = os.path.join(IMAGE_CACHE_DIR, f"{stem}-{mtime_ns}-{width}-q{quality}.{EXTENSIONS[fmt]}")
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            return f.read()
+    data = encode_image(path, width, fmt, quality)
+    _write_atomic(cache_path, data)
+    return data
+
+def image_variant(path, width, fmt=None, quality=80):
+    # Encoded bytes for `path` at most `width` pixels wide, cached in memory and on disk
+    return _image_variant(path, os.stat(path).st_mtime_ns, width, fmt or default_format(), quality)
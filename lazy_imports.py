@@ -0,0 +1,34 @@
+import importlib
+import sys
+import time
+
+import pandas as pd
+from streamlit.logger import get_logger
+
+# Uses Streamlit's log handler, so paid imports show up in the server log
+logger = get_logger(__name__)
+
+# module name -> (seconds spent importing, whether this process paid for it)
+_import_times = {}
+
+def lazy_import(name):
+    # Import a plotting backend the first time a page asks for it
+    if name in _import_times:
+        return sys.modules[name]
+    already_loaded = name in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    elapsed = time.perf_counter() - start
+    _import_times[name] = (elapsed, not already_loaded)
+    if not already_loaded:
+        logger.info("Imported %s in %.3fs", name, elapsed)
+    return module
+
+def import_report():
+    # Which lazy imports have been paid for in this process, slowest first
+    rows = [
+        {'Module': name, 'Seconds': round(elapsed, 4), 'Paid': paid}
+        for name, (elapsed, paid) in _import_times.items()
+    ]
+    report = pd.DataFrame(rows, columns=['Module', 'Seconds', 'Paid'])
+    return report.sort_values('Seconds', ascending=False, ignore_index=True)
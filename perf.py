@@ -0,0 +1,95 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from streamlit.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Append one JSON line per timed section to this file when set
+PERF_LOG_ENV = "DATAVIZ_PERF_LOG"
+
+# Show the "Performance" page in the navbar when set to 1
+PERF_PAGE_ENV = "DATAVIZ_PERF_PAGE"
+
+# Recent samples kept per section for the report
+SAMPLES_PER_SECTION = 200
+
+# section name -> recent durations in seconds, shared by every session in the process
+_timings = {}
+_lock = threading.Lock()
+
+def perf_page_enabled():
+    return os.environ.get(PERF_PAGE_ENV) == "1"
+
+def record(name, seconds):
+    # Keep the sample for the report and export it to the structured log if one is configured
+    with _lock:
+        _timings.setdefault(name, deque(maxlen=SAMPLES_PER_SECTION)).append(seconds)
+    log_path = os.environ.get(PERF_LOG_ENV)
+    if log_path:
+        entry = {'section': name, 'seconds': round(seconds, 6), 'time': time.time(), 'pid': os.getpid()}
+        try:
+            with open(log_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError:
+            logger.warning("Could not write timing to %s", log_path)
+
+@contextmanager
+def timed(name):
+    # Time the enclosed block, including when it raises
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+def timed_function(name=None):
+    # Decorator form of timed(); the section defaults to module.function
+    def decorator(func):
+        section = name or f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(section):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def timing_report():
+    # One row per section, slowest mean first
+    with _lock:
+        samples = {name: np.array(durations) for name, durations in _timings.items()}
+    rows = [
+        {
+            'Section': name,
+            'Samples': len(durations),
+            'Mean ms': round(durations.mean() * 1000, 2),
+            'p95 ms': round(np.percentile(durations, 95) * 1000, 2),
+            'Max ms': round(durations.max() * 1000, 2),
+            'Last ms': round(durations[-1] * 1000, 2),
+        }
+        for name, durations in samples.items()
+    ]
+    report = pd.DataFrame(rows, columns=['Section', 'Samples', 'Mean ms', 'p95 ms', 'Max ms', 'Last ms'])
+    return report.sort_values('Mean ms', ascending=False, ignore_index=True)
+
+def export_timings():
+    # Every kept sample as JSON lines, in the same shape as the structured log
+    with _lock:
+        samples = {name: list(durations) for name, durations in _timings.items()}
+    return "".join(
+        json.dumps({'section': name, 'seconds': round(seconds, 6)}) + "\n"
+        for name, durations in samples.items()
+        for seconds in durations
+    )
+
+def reset_timings():
+    with _lock:
+        _timings.clear()
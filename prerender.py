@@ -0,0 +1,118 @@
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import streamlit as st
+from streamlit.logger import get_logger
+
+from charts import (
+    SHINKANSEN_GRAPH, build_company_bar_chart, build_prefecture_bar_figure, build_station_scatter, figure_to_png,
+    plotly_figure_from_json
+)
+from data import DATA_PATH
+from lazy_imports import lazy_import
+from server_transforms import chart_json
+from snapshot import get_refresher
+
+logger = get_logger(__name__)
+
+# Matplotlib and Graphviz rendering are CPU-bound, so the gallery renders in processes
+PRERENDER_WORKERS = 2
+
+# Columns build_station_scatter draws from
+STATION_SCATTER_COLUMNS = ['Longitude', 'Latitude', 'Shinkansen_Line']
+
+# The renderers run in worker processes: plain functions of data taken from one snapshot, no Streamlit caches
+
+def render_matplotlib(stations):
+    return figure_to_png(build_station_scatter(stations))
+
+def render_altair(per_company):
+    return chart_json(build_company_bar_chart(per_company))
+
+def render_plotly(per_prefecture):
+    return build_prefecture_bar_figure(per_prefecture).to_json()
+
+def render_graphviz():
+    # Graphviz is optional: without it the page falls back to drawing the DOT source in the browser
+    try:
+        graphviz = lazy_import('graphviz')
+    except ImportError:
+        return None
+    try:
+        return graphviz.Source(SHINKANSEN_GRAPH).pipe(format='svg').decode()
+    except graphviz.ExecutableNotFound:
+        return None
+
+RENDERERS = {
+    'Matplotlib': render_matplotlib,
+    'Altair': render_altair,
+    'Plotly': render_plotly,
+    'Graphviz': render_graphviz,
+}
+
+# Artifacts stored as JSON text, and how the page turns them back into charts
+JSON_ARTIFACTS = {'Altair': 'spec', 'Plotly': 'figure'}
+
+def render_inputs(snapshot):
+    # Arguments for each renderer, taken from the snapshot being rendered so the workers
+    # never re-read the source or recompute aggregates, and always render that version.
+    # The station scatter is only pre-rendered when the snapshot already holds the frame.
+    aggregates = snapshot['aggregates']
+    inputs = {
+        'Altair': (aggregates['per_company'],),
+        'Plotly': (aggregates['per_prefecture'],),
+        'Graphviz': (),
+    }
+    if 'frame' in snapshot:
+        inputs['Matplotlib'] = (snapshot['frame'][STATION_SCATTER_COLUMNS],)
+    return inputs
+
+@st.cache_resource(show_spinner=False)
+def prerender_pool():
+    # Workers forked from a clean forkserver that has only imported this module: forking the
+    # multi-threaded server itself could hand workers locks held by other threads, and spawn
+    # would re-run the page, which Streamlit executes as __main__.
+    # Without forkserver (Windows) there is no pool and the gallery renders inline.
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return None
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload([__name__])
+    return ProcessPoolExecutor(max_workers=PRERENDER_WORKERS, mp_context=context)
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def prerender_gallery(path, version, _snapshot):
+    # Submit every gallery artifact for this dataset version; chart name -> Future.
+    # `_snapshot` is that version's snapshot and isn't part of the cache key.
+    pool = prerender_pool()
+    if pool is None:
+        return {}
+    inputs = render_inputs(_snapshot)
+    return {name: pool.submit(RENDERERS[name], *args) for name, args in inputs.items()}
+
+@st.cache_resource(show_spinner=False)
+def start_prerendering(path=DATA_PATH):
+    # Render for the current snapshot now, and again whenever the refresher swaps one in
+    refresher = get_refresher(path)
+    refresher.add_listener(lambda snapshot: prerender_gallery(path, snapshot['version'], snapshot))
+    snapshot = refresher.snapshot
+    prerender_gallery(path, snapshot['version'], snapshot)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _load_json(text):
+    return json.loads(text)
+
+def gallery_artifact(path, snapshot, name):
+    # The pre-rendered artifact, or None while it is still rendering (or failed) so the page renders inline
+    future = prerender_gallery(path, snapshot['version'], snapshot).get(name)
+    if future is None or not future.done():
+        return None
+    if future.exception() is not None:
+        logger.warning("Pre-rendering %s failed: %r", name, future.exception())
+        return None
+    artifact = future.result()
+    if artifact is None or name not in JSON_ARTIFACTS:
+        return artifact
+    if JSON_ARTIFACTS[name] == 'figure':
+        return plotly_figure_from_json(artifact)
+    return _load_json(artifact)
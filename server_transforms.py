@@ -0,0 +1,287 @@
+import math
+import threading
+
+import numpy as np
+import pandas as pd
+from streamlit.logger import get_logger
+
+from lazy_imports import lazy_import
+from perf import timed_function
+
+logger = get_logger(__name__)
+
+# Rows an Altair chart may embed once its transforms ran here; Altair's own default stops at 5000
+ALTAIR_MAX_ROWS = 100_000
+
+# Vega-Lite aggregate ops and their pandas equivalents
+AGGREGATE_OPS = {
+    'count': 'size',
+    'valid': 'count',
+    'missing': lambda values: values.isna().sum(),
+    'distinct': lambda values: values.nunique(dropna=False),
+    'sum': 'sum',
+    'mean': 'mean',
+    'average': 'mean',
+    'median': 'median',
+    'min': 'min',
+    'max': 'max',
+    'stdev': 'std',
+    'stdevp': lambda values: values.std(ddof=0),
+    'variance': 'var',
+    'variancep': lambda values: values.var(ddof=0),
+    'q1': lambda values: values.quantile(0.25),
+    'q3': lambda values: values.quantile(0.75),
+}
+
+# Field predicates of a filter transform
+PREDICATES = {
+    'equal': lambda values, x: values == x,
+    'oneOf': lambda values, x: values.isin(x),
+    'lt': lambda values, x: values < x,
+    'lte': lambda values, x: values <= x,
+    'gt': lambda values, x: values > x,
+    'gte': lambda values, x: values >= x,
+    'range': lambda values, x: _in_range(values, *x),
+    'valid': lambda values, x: values.notna() == x,
+}
+
+# Predicates that order values, which pandas can't do for unordered categoricals
+ORDERING_PREDICATES = {'lt', 'lte', 'gt', 'gte', 'range'}
+
+# Keys of a Vega-Lite DateTime object and the Timestamp fields they set; 'day' and 'quarter' are left to Vega
+DATETIME_FIELDS = {
+    'year': 'year', 'month': 'month', 'date': 'day',
+    'hours': 'hour', 'minutes': 'minute', 'seconds': 'second', 'milliseconds': 'microsecond',
+}
+
+MONTH_NAMES = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+# Data transformers are global to the process, so serializing with a raised limit is serialized too
+_transformer_lock = threading.Lock()
+
+class UnsupportedTransform(Exception):
+    # The chart uses something only Vega can evaluate; it is then left as it was
+    pass
+
+def _field(frame, definition):
+    field = definition.get('field')
+    if field not in frame:
+        raise UnsupportedTransform(f"field {field!r}")
+    return field
+
+def _in_range(values, low, high):
+    # Vega's range is inclusive, and a null bound leaves that side open
+    mask = pd.Series(True, index=values.index)
+    if low is not None:
+        mask &= values >= low
+    if high is not None:
+        mask &= values <= high
+    return mask
+
+def _datetime(value):
+    # A Vega-Lite DateTime object as a local Timestamp; Vega defaults the year to 2012
+    if set(value) - set(DATETIME_FIELDS):
+        raise UnsupportedTransform(f"DateTime {value!r}")
+    fields = {'year': 2012, 'month': 1, 'day': 1}
+    for key, number in value.items():
+        if key == 'month' and isinstance(number, str):
+            if number[:3].lower() not in MONTH_NAMES:
+                raise UnsupportedTransform(f"DateTime {value!r}")
+            number = MONTH_NAMES.index(number[:3].lower()) + 1
+        fields[DATETIME_FIELDS[key]] = int(number) * (1000 if key == 'milliseconds' else 1)
+    return pd.Timestamp(**fields)
+
+def _operand(values, op, x):
+    # The predicate's operand as pandas should compare it, or UnsupportedTransform where
+    # pandas would raise or compare differently from Vega
+    if isinstance(x, list):
+        return [_operand(values, op, item) for item in x]
+    if isinstance(x, dict):
+        x = _datetime(x)
+    if x is None or op == 'valid':
+        return x
+    if pd.api.types.is_datetime64_any_dtype(values) != isinstance(x, pd.Timestamp):
+        raise UnsupportedTransform(f"{op} {x!r} on a {values.dtype} field")
+    if op in ORDERING_PREDICATES and isinstance(values.dtype, pd.CategoricalDtype) and not values.cat.ordered:
+        raise UnsupportedTransform(f"{op} on an unordered categorical field")
+    return x
+
+def _predicate_mask(frame, predicate):
+    # Boolean mask for a field predicate, including and/or/not combinations of them
+    if not isinstance(predicate, dict):
+        raise UnsupportedTransform(f"filter {predicate!r}")
+    if 'and' in predicate:
+        return np.logical_and.reduce([_predicate_mask(frame, p) for p in predicate['and']])
+    if 'or' in predicate:
+        return np.logical_or.reduce([_predicate_mask(frame, p) for p in predicate['or']])
+    if 'not' in predicate:
+        return ~_predicate_mask(frame, predicate['not'])
+    if 'timeUnit' in predicate:
+        raise UnsupportedTransform("timeUnit filter")
+    values = frame[_field(frame, predicate)]
+    tests = [
+        PREDICATES[op](values, _operand(values, op, predicate[op]))
+        for op in PREDICATES if op in predicate
+    ]
+    if not tests:
+        raise UnsupportedTransform(f"filter {predicate!r}")
+    return np.logical_and.reduce(tests)
+
+def bin_extent(start, stop, maxbins=10, base=10, divide=(5, 2)):
+    # Vega's nice bin boundaries: (start, stop, step) covering start..stop in at most maxbins bins
+    span = stop - start
+    if span <= 0:
+        return start, start + 1, 1
+    logb = math.log(base)
+    level = math.ceil(math.log(maxbins) / logb)
+    step = max(0, base ** (round(math.log(span) / logb) - level))
+    while math.ceil(span / step) > maxbins:
+        step *= base
+    for div in divide:
+        v = step / div
+        if span / v <= maxbins:
+            step = v
+    v = math.log(step)
+    precision = 0 if v >= 0 else int(-v / logb) + 1
+    eps = base ** (-precision - 1)
+    v = math.floor(start / step + eps) * step
+    start = v - step if start < v else v
+    stop = math.ceil(stop / step) * step
+    return start, stop, step
+
+def bin_values(values, maxbins=10):
+    # Bin start and end per value, assigned the way Vega's bin transform does
+    numbers = pd.to_numeric(values)
+    start, stop, step = bin_extent(numbers.min(), numbers.max(), maxbins)
+    clamped = numbers.clip(start, stop - step)
+    bin_start = start + step * np.floor(1e-14 + (clamped - start) / step)
+    return bin_start, bin_start + step
+
+def _aggregate(frame, groupby, measures):
+    # measures: (op, field or None, output name); one row per group, in order of first appearance
+    columns = {}
+    for op, field, name in measures:
+        if op not in AGGREGATE_OPS:
+            raise UnsupportedTransform(f"aggregate {op!r}")
+        if field is None and op != 'count':
+            raise UnsupportedTransform(f"aggregate {op!r} without a field")
+        columns[name] = (field or frame.columns[0], AGGREGATE_OPS[op])
+    if not groupby:
+        return pd.DataFrame({name: [frame[field].agg(func)] for name, (field, func) in columns.items()})
+    grouped = frame.groupby(groupby, sort=False, dropna=False, observed=True)
+    return grouped.agg(**columns).reset_index()
+
+def _aggregate_name(op, field):
+    return '__count' if field is None else f"{op}_{field}"
+
+def _aggregate_title(op, field):
+    # Vega-Lite's default axis and legend titles for aggregated fields
+    if field is None:
+        return 'Count of Records'
+    label = {'mean': 'Average', 'average': 'Average', 'stdev': 'Standard Deviation'}.get(op, op.title())
+    return f"{label} of {field}"
+
+def _run_transforms(frame, transforms):
+    for transform in transforms:
+        if 'filter' in transform:
+            frame = frame[_predicate_mask(frame, transform['filter'])]
+        elif 'bin' in transform:
+            maxbins = transform['bin'].get('maxbins', 10) if isinstance(transform['bin'], dict) else 10
+            names = transform['as'] if isinstance(transform['as'], list) else [transform['as'], f"{transform['as']}_end"]
+            start, end = bin_values(frame[_field(frame, transform)], maxbins)
+            frame = frame.assign(**{names[0]: start, names[1]: end})
+        elif 'aggregate' in transform:
+            measures = [(m['op'], m.get('field'), m['as']) for m in transform['aggregate']]
+            for field in transform.get('groupby', []):
+                _field(frame, {'field': field})
+            frame = _aggregate(frame, transform.get('groupby', []), measures)
+        else:
+            raise UnsupportedTransform(f"transform {sorted(transform)}")
+    return frame
+
+def _run_encoding(frame, encoding):
+    # Evaluate encoding-level bin and aggregate; returns the data and the rewritten encoding
+    encoding = {channel: (list(defs) if isinstance(defs, list) else defs) for channel, defs in encoding.items()}
+    groupby, measures = [], []
+    for channel, defs in list(encoding.items()):
+        for definition in (defs if isinstance(defs, list) else [defs]):
+            if not isinstance(definition, dict):
+                continue
+            if 'timeUnit' in definition:
+                raise UnsupportedTransform("timeUnit encoding")
+            if 'aggregate' in definition:
+                op, field = definition.pop('aggregate'), definition.get('field')
+                if isinstance(op, dict):
+                    raise UnsupportedTransform(f"aggregate {op!r}")
+                if field is not None:
+                    _field(frame, definition)
+                name = _aggregate_name(op, field)
+                measures.append((op, field, name))
+                definition.setdefault('title', _aggregate_title(op, field))
+                definition['field'] = name
+                definition['type'] = 'quantitative'
+            elif definition.get('bin') not in (None, False, 'binned'):
+                field = _field(frame, definition)
+                maxbins = definition['bin'].get('maxbins', 10) if isinstance(definition['bin'], dict) else 10
+                start_name, end_name = f"bin_maxbins_{maxbins}_{field}", f"bin_maxbins_{maxbins}_{field}_end"
+                start, end = bin_values(frame[field], maxbins)
+                frame = frame.assign(**{start_name: start, end_name: end})
+                definition.update(field=start_name, bin='binned')
+                definition.setdefault('title', f"{field} (binned)")
+                groupby += [start_name, end_name]
+                if channel in ('x', 'y') and f"{channel}2" not in encoding:
+                    encoding[f"{channel}2"] = {'field': end_name}
+            elif 'field' in definition:
+                groupby.append(_field(frame, definition))
+    if measures:
+        frame = _aggregate(frame, list(dict.fromkeys(groupby)), measures)
+    return frame, encoding
+
+@timed_function()
+def evaluate_transforms(chart, max_rows=ALTAIR_MAX_ROWS):
+    # Equivalent chart whose filter, bin and aggregate transforms already ran in pandas, so only
+    # the result rows are embedded. Charts using anything else are returned unchanged.
+    alt = lazy_import('altair')
+    data = chart.data
+    if not isinstance(chart, alt.Chart) or not isinstance(data, pd.DataFrame):
+        return chart
+
+    # The spec without its rows, for Altair to resolve shorthands and types
+    light = chart.copy(deep=True, ignore=['data'])
+    light.data = data.iloc[:0]
+    spec = light.to_dict(validate=False)
+    transforms = spec.pop('transform', [])
+    encoding = spec.get('encoding', {})
+    try:
+        frame = _run_transforms(data, transforms)
+        frame, spec['encoding'] = _run_encoding(frame, encoding)
+    except UnsupportedTransform as e:
+        logger.debug("Leaving transforms to Vega: %s", e)
+        return chart
+    except (TypeError, ValueError) as e:
+        # Data pandas can't evaluate the way the spec asks; Vega still can
+        logger.debug("Leaving transforms to Vega after %r", e)
+        return chart
+    if frame is data:
+        # Nothing to evaluate
+        return chart
+    if max_rows is not None and len(frame) > max_rows:
+        raise lazy_import('altair.utils.data').MaxRowsError(
+            f"The evaluated chart still has {len(frame):,} rows, more than max_rows={max_rows:,}"
+        )
+
+    for key in ('data', 'datasets', '$schema'):
+        spec.pop(key, None)
+    if chart.config is alt.Undefined:
+        # Added by the active theme rather than the chart; leave theming to whoever renders it
+        spec.pop('config', None)
+    evaluated = alt.Chart.from_dict(spec, validate=False)
+    evaluated.data = frame.reset_index(drop=True)
+    return evaluated
+
+def chart_json(chart, max_rows=ALTAIR_MAX_ROWS):
+    # Serialize after evaluating transforms, allowing up to max_rows embedded rows instead of Altair's 5000
+    alt = lazy_import('altair')
+    evaluated = evaluate_transforms(chart, max_rows=max_rows)
+    with _transformer_lock, alt.data_transformers.enable('default', max_rows=max_rows):
+        return evaluated.to_json()
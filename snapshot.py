@@ -0,0 +1,130 @@
+import threading
+import time
+
+import streamlit as st
+from streamlit.logger import get_logger
+
+from aggregates import large_source, load_aggregates, load_year_index
+from backends import configured_backend
+from data import DATA_PATH, dataset_version, load_dataset
+
+logger = get_logger(__name__)
+
+# Seconds between checks of the source file; a check is a stat unless the file changed
+REFRESH_INTERVAL = 5
+
+# Snapshot entries that need the whole frame, and how to load them for a version
+FRAME_LOADERS = {'frame': load_dataset, 'year_index': load_year_index}
+
+class Snapshot(dict):
+    # A snapshot dict whose FRAME_LOADERS entries, when not built up front, load on first access
+
+    def __init__(self, path, values):
+        super().__init__(values)
+        self.path = path
+
+    def __missing__(self, key):
+        if key not in FRAME_LOADERS:
+            raise KeyError(key)
+        value = self[key] = FRAME_LOADERS[key](self.path, self['version'])
+        return value
+
+def frame_up_front(path):
+    # Small sources on the pandas backend build the frame with the snapshot, since the aggregates
+    # come from it anyway. Otherwise only pages that draw rows load it, so pages that only chart
+    # aggregates never hold the whole frame.
+    return configured_backend() == 'pandas' and not large_source(path)
+
+def build_snapshot(path, version):
+    # Typed frame plus everything precomputed from it, for one dataset version.
+    # Going through the cached loaders also warms them for the chart builders.
+    start = time.perf_counter()
+    snapshot = Snapshot(path, {'version': version})
+    if frame_up_front(path):
+        for key, load in FRAME_LOADERS.items():
+            snapshot[key] = load(path, version)
+    snapshot['aggregates'] = load_aggregates(path, version)
+    snapshot['build_seconds'] = time.perf_counter() - start
+    snapshot['built_at'] = time.time()
+    return snapshot
+
+class SnapshotRefresher:
+    # Watches the source in a daemon thread and swaps in a new snapshot once it is fully built.
+    # Reruns read `snapshot` once and keep that object, so a swap never changes data under them.
+
+    def __init__(self, path=DATA_PATH, interval=REFRESH_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.last_checked = time.time()
+        self.last_error = None
+        self._failed_version = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._snapshot = build_snapshot(path, dataset_version(path))
+        self._thread = threading.Thread(target=self._run, name="snapshot-refresher", daemon=True)
+        self._thread.start()
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def refresh(self):
+        # Build and swap in a new snapshot if the source changed; True when a swap happened
+        with self._lock:
+            version = dataset_version(self.path)
+            self.last_checked = time.time()
+            if version in (self._snapshot['version'], self._failed_version):
+                return False
+            try:
+                snapshot = build_snapshot(self.path, version)
+            except Exception:
+                # Don't retry a broken file until it changes again
+                self._failed_version = version
+                raise
+            self._snapshot = snapshot
+            self.last_error = None
+        logger.info("Swapped in dataset %s (built in %.3fs)", version, snapshot['build_seconds'])
+        for listener in list(self._listeners):
+            try:
+                listener(snapshot)
+            except Exception:
+                logger.exception("Snapshot listener %r failed", listener)
+        return True
+
+    def add_listener(self, callback):
+        # callback(snapshot) runs on the refresher thread after every swap
+        self._listeners.append(callback)
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        # Monitoring view of the current snapshot and the refresher
+        snapshot = self._snapshot
+        return {
+            'version': snapshot['version'],
+            'build_seconds': snapshot['build_seconds'],
+            'built_at': snapshot['built_at'],
+            'last_checked': self.last_checked,
+            'last_error': self.last_error,
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the last good snapshot; the file is retried once it changes again
+                self.last_error = repr(e)
+                logger.exception("Dataset refresh failed, keeping %s", self._snapshot['version'])
+
+@st.cache_resource(show_spinner=False)
+def get_refresher(path=DATA_PATH):
+    # One refresher per process and source. Streamlit has no server-start hook, so the first
+    # snapshot is built inside the first rerun that asks for it; only later versions are
+    # built in the background.
+    return SnapshotRefresher(path)
+
+def current_snapshot(path=DATA_PATH):
+    return get_refresher(path).snapshot
@@ -0,0 +1,102 @@
+import altair as alt
+import pandas as pd
+import pytest
+
+from server_transforms import bin_extent, evaluate_transforms
+
+@pytest.fixture
+def stations():
+    # Same column types as the typed dataset
+    return pd.DataFrame({
+        'Year': pd.to_datetime(['1964', '1975', '1982', '1997', '2004', '2010', '2015', '2016'], format='%Y'),
+        'Company': pd.Categorical(['JR Central', 'JR West', 'JR East', 'JR East', 'JR Kyushu', 'JR East', 'JR West', 'JR Hokkaido']),
+        'Prefecture': pd.Categorical(['Tokyo', 'Okayama', 'Miyagi', 'Nagano', 'Kagoshima', 'Aomori', 'Toyama', 'Hokkaido']),
+        'Distance from Tokyo Station': [0.0, 676.3, 351.8, 222.4, 1325.9, 713.7, 391.9, 862.5],
+    })
+
+def values(chart):
+    assert isinstance(chart.data, pd.DataFrame)
+    return chart.data
+
+def test_filter_equal_and_one_of(stations):
+    chart = alt.Chart(stations).mark_point().encode(x='Company:N', y='Distance from Tokyo Station:Q')
+    equal = evaluate_transforms(chart.transform_filter(alt.FieldEqualPredicate(field='Company', equal='JR East')))
+    assert list(values(equal)['Prefecture']) == ['Miyagi', 'Nagano', 'Aomori']
+    # Expression filters stay with Vega
+    expression = chart.transform_filter(alt.datum.Company == 'JR East')
+    assert evaluate_transforms(expression) is expression
+    evaluated = evaluate_transforms(chart.transform_filter(alt.FieldOneOfPredicate(field='Company', oneOf=['JR East', 'JR West'])))
+    assert sorted(values(evaluated)['Company']) == ['JR East', 'JR East', 'JR East', 'JR West', 'JR West']
+
+def test_filter_numeric_range(stations):
+    chart = alt.Chart(stations).mark_point().encode(x='Company:N', y='Distance from Tokyo Station:Q').transform_filter(
+        alt.FieldRangePredicate(field='Distance from Tokyo Station', range=[351.8, 713.7])
+    )
+    assert sorted(values(evaluate_transforms(chart))['Distance from Tokyo Station']) == [351.8, 391.9, 676.3, 713.7]
+
+def test_filter_datetime_operands(stations):
+    chart = alt.Chart(stations).mark_point().encode(x='Company:N', y='Distance from Tokyo Station:Q')
+    in_range = evaluate_transforms(chart.transform_filter(
+        alt.FieldRangePredicate(field='Year', range=[alt.DateTime(year=1980), alt.DateTime(year=2010)])
+    ))
+    assert list(values(in_range)['Year'].dt.year) == [1982, 1997, 2004, 2010]
+    after = evaluate_transforms(chart.transform_filter(
+        alt.FieldGTPredicate(field='Year', gt=alt.DateTime(year=2010, month='Jan', date=2))
+    ))
+    assert list(values(after)['Year'].dt.year) == [2015, 2016]
+
+def test_bin_extent_matches_vega():
+    assert bin_extent(0, 100) == (0, 100, 10)
+    assert bin_extent(0.0, 1325.9) == (0, 1400, 200)
+    assert bin_extent(3, 3) == (3, 4, 1)
+
+def test_encoding_bin_and_count(stations):
+    chart = alt.Chart(stations).mark_bar().encode(
+        x=alt.X('Distance from Tokyo Station:Q', bin=alt.Bin(maxbins=5)), y='count()'
+    )
+    evaluated = evaluate_transforms(chart)
+    counts = values(evaluated).set_index('bin_maxbins_5_Distance from Tokyo Station')['__count'].sort_index()
+    assert counts.to_dict() == {0: 4, 500: 3, 1000: 1}
+    spec = evaluated.to_dict()
+    assert spec['encoding']['x']['bin'] == 'binned'
+    assert spec['encoding']['x2']['field'] == 'bin_maxbins_5_Distance from Tokyo Station_end'
+
+def test_aggregate_transform_and_encoding(stations):
+    transform = alt.Chart(stations).mark_bar().encode(x='Company:N', y='total:Q').transform_aggregate(
+        total='sum(Distance from Tokyo Station)', groupby=['Company']
+    )
+    totals = values(evaluate_transforms(transform)).set_index('Company')['total']
+    assert totals['JR East'] == pytest.approx(351.8 + 222.4 + 713.7)
+
+    encoding = alt.Chart(stations).mark_bar().encode(x='Company:N', y='mean(Distance from Tokyo Station):Q')
+    evaluated = evaluate_transforms(encoding)
+    means = values(evaluated).set_index('Company')['mean_Distance from Tokyo Station']
+    assert means['JR West'] == pytest.approx((676.3 + 391.9) / 2)
+    assert evaluated.to_dict()['encoding']['y']['title'] == 'Average of Distance from Tokyo Station'
+    assert len(values(evaluated)) == 5
+
+@pytest.mark.parametrize('predicate', [
+    # Ordering an unordered categorical
+    alt.FieldLTPredicate(field='Prefecture', lt='M'),
+    # Numbers compared against a datetime field
+    alt.FieldRangePredicate(field='Year', range=[1980, 2010]),
+    # DateTime parts that only Vega resolves
+    alt.FieldGTPredicate(field='Year', gt=alt.DateTime(year=2000, quarter=2)),
+    # Fields that aren't in the data
+    alt.FieldEqualPredicate(field='Missing', equal=1),
+])
+def test_unsupported_filters_are_left_to_vega(stations, predicate):
+    chart = alt.Chart(stations).mark_point().encode(x='Company:N', y='Distance from Tokyo Station:Q').transform_filter(predicate)
+    assert evaluate_transforms(chart) is chart
+
+def test_pandas_errors_are_left_to_vega(stations):
+    # A string field compared against a number makes pandas raise
+    stations['Name'] = stations['Prefecture'].astype(str)
+    chart = alt.Chart(stations).mark_point().encode(x='Name:N').transform_filter(
+        alt.FieldGTPredicate(field='Name', gt=3)
+    )
+    assert evaluate_transforms(chart) is chart
+
+def test_nothing_to_evaluate(stations):
+    chart = alt.Chart(stations).mark_point().encode(x='Company:N', y='Distance from Tokyo Station:Q')
+    assert evaluate_transforms(chart) is chart